@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录对比性能测试工具
+
+生成可重复的合成目录树（或等价的扫描清单），使用不同的对比选项运行对比，
+分别统计扫描（get_files_in_dir）、分析（_analyze_differences）、
+文本和JSON格式化（format_output）的耗时，以及各阶段结束时的内存峰值
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import shutil
+import multiprocessing
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Dict, List
+
+from dir_compare import (DirCompare, CompareConfig, compute_digests, load_manifest, save_manifest,
+                         MANIFEST_FORMAT, MANIFEST_VERSION)
+
+try:
+    import resource
+except ImportError:
+    # Windows 下没有 resource 模块，不统计内存峰值
+    resource = None
+
+# 预设的对比选项组合
+BENCHMARK_CONFIGS = {
+    'default': {},
+    'ignore-ext': {'ignore_extension': True},
+    'split': {'split_char': '.', 'split_index': 0},
+    'key-pattern': {'key_pattern': r'_(\d+)', 'case_fold': True},
+    'no-recursive': {'recursive': False},
+    'single-thread': {'workers': 1},
+}
+
+# 名称模式
+NAME_PATTERNS = ('asset', 'version', 'words')
+
+ASSET_KINDS = (('texture', '.png'), ('model', '.fbx'), ('audio', '.wav'), ('prefab', '.prefab'), ('script', '.lua'))
+
+WORDS = ('alpha beta gamma delta render shader texture model anim sound config player enemy level '
+         'scene button icon effect water stone cloud').split()
+
+
+def _base_name(rng, pattern, index):
+    """生成基准文件名，返回 (主干, 扩展名)"""
+    if pattern == 'asset':
+        kind, ext = ASSET_KINDS[index % len(ASSET_KINDS)]
+        return f'{kind}_asset_{index:07d}', ext
+    if pattern == 'version':
+        return f'{rng.choice(WORDS)}_{index}_v1', '.txt'
+    words = '_'.join(rng.choice(WORDS) for _ in range(rng.randint(2, 3)))
+    return f'{words}_{index}', rng.choice(('.png', '.txt', '.json'))
+
+
+def _variant_name(rng, pattern, stem, ext, tree):
+    """生成某棵树独有的变体名称：改版本号、改一个字符或改大小写"""
+    if pattern == 'version':
+        return f'{stem[:-1]}{tree + 2}{ext}'
+    choice = rng.random()
+    if choice < 0.4:
+        position = rng.randrange(len(stem))
+        return f'{stem[:position]}x{stem[position + 1:]}{ext}'
+    if choice < 0.7:
+        return f'{stem.upper()}{ext}'
+    return f'{stem}_t{tree}{ext}'
+
+
+def _tree_layout(files, depth, fan_out):
+    """每个文件所在的相对目录（'/' 分隔），文件大致均匀分布在 fan_out^depth 个叶子目录中"""
+    directories = []
+    for index in range(files):
+        parts = []
+        rest = index
+        for _ in range(depth):
+            parts.append(f'dir_{rest % fan_out}')
+            rest //= fan_out
+        directories.append('/'.join(parts))
+    return directories
+
+
+def generate_trees(output_dir, files=10000, trees=2, depth=3, fan_out=10, pattern='asset',
+                   overlap=0.9, as_manifest=False, seed=0):
+    """
+    生成合成目录树
+    
+    所有树共用一组基准文件名和目录结构，每棵树中的每个文件以 overlap 的概率使用基准名称，
+    否则换成该树独有的变体名称（改版本号、改一个字符、改大小写或加后缀）
+    
+    Args:
+        output_dir: 输出目录，其中生成 tree_0、tree_1 ...
+        files: 每棵树的文件数
+        trees: 树的数量
+        depth: 目录嵌套层数
+        fan_out: 每层的子目录数
+        pattern: 名称模式 asset（编号资源名）、version（带版本号）或 words（随机单词）
+        overlap: 每棵树中使用基准名称的文件比例
+        as_manifest: 为 True 时不创建文件，而是生成等价的扫描清单 tree_N.json
+        seed: 随机种子，相同参数和种子生成的目录树完全相同
+    
+    Returns:
+        生成的目录或清单路径列表
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    base = [_base_name(rng, pattern, index) for index in range(files)]
+    directories = _tree_layout(files, depth, fan_out)
+    
+    outputs = []
+    for tree in range(trees):
+        names = [f'{stem}{ext}' if rng.random() < overlap else _variant_name(rng, pattern, stem, ext, tree)
+                 for stem, ext in base]
+        
+        if as_manifest:
+            output = output_dir / f'tree_{tree}.json'
+            save_manifest(_build_manifest(output, names, directories), str(output))
+        else:
+            output = output_dir / f'tree_{tree}'
+            created = set()
+            for name, relative_dir in zip(names, directories):
+                target_dir = output / relative_dir
+                if relative_dir not in created:
+                    target_dir.mkdir(parents=True, exist_ok=True)
+                    created.add(relative_dir)
+                (target_dir / name).touch()
+        outputs.append(str(output))
+        print(f"  已生成 {output}")
+    return outputs
+
+
+def _build_manifest(output, names, directories):
+    """按生成的文件名和目录构造与 build_manifest 相同格式的清单"""
+    records = {'': {'mtime': 0, 'dirs': set(), 'files': []}}
+    for name, relative_dir in zip(names, directories):
+        record = records.get(relative_dir)
+        if record is None:
+            # 逐级登记上级目录
+            parts = relative_dir.split('/')
+            for level in range(len(parts)):
+                parent = '/'.join(parts[:level])
+                current = '/'.join(parts[:level + 1])
+                records[parent]['dirs'].add(parts[level])
+                records.setdefault(current, {'mtime': 0, 'dirs': set(), 'files': []})
+            record = records[relative_dir]
+        record['files'].append([name, 0, 0])
+    
+    directories = {}
+    for relative_dir, record in sorted(records.items()):
+        directories[relative_dir] = {'mtime': 0, 'dirs': sorted(record['dirs']), 'files': sorted(record['files'])}
+    compute_digests(directories, use_hashes=False)
+    return {
+        'format': MANIFEST_FORMAT,
+        'version': MANIFEST_VERSION,
+        'root': str(output),
+        'recursive': True,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'directories': directories
+    }
+
+
+def _peak_mb():
+    """当前进程的RSS峰值（MB），Linux 下 ru_maxrss 单位为KB，macOS 下为字节"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_comparison(paths: List[str], options: Dict) -> Dict:
+    """在独立进程中执行一次对比，逐阶段记录耗时和内存峰值"""
+    comparer = DirCompare(CompareConfig(paths=paths, **options))
+    stages = {}
+    sizes = {}
+    
+    def measure(name, func):
+        start = time.perf_counter()
+        value = func()
+        stages[name] = (time.perf_counter() - start, _peak_mb())
+        return value
+    
+    with redirect_stdout(io.StringIO()):
+        measure('get_files_in_dir', lambda: comparer.file_sets.update(
+            (path, comparer.get_files_in_dir(path)) for path in paths))
+        result = measure('_analyze_differences', comparer._analyze_differences)
+        for output_format in ('text', 'json'):
+            comparer.config.output_format = output_format
+            sizes[output_format] = len(measure(f'format_output:{output_format}',
+                                               lambda: comparer.format_output(result)))
+    
+    return {
+        'stages': stages,
+        'output_sizes': sizes,
+        'keys': sum(len(file_set) for file_set in comparer.file_sets.values()),
+        'unique_keys': result.get('summary', {}).get('total_unique_files', 0),
+    }
+
+
+def count_files(path: str, recursive: bool = True) -> int:
+    """统计目录或清单中要扫描的文件数，用于计算扫描吞吐量（分割等选项会合并键，不能用键数代替）"""
+    if os.path.isfile(path):
+        directories = load_manifest(path)['directories']
+        return sum(len(record['files']) for posix_dir, record in directories.items() if recursive or not posix_dir)
+    if not recursive:
+        with os.scandir(path) as it:
+            return sum(1 for entry in it if entry.is_file())
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+def run_benchmark(paths: List[str], config_names: List[str], max_items: int = None) -> Dict[str, Dict]:
+    """
+    依次使用每组选项对比目录树，每次对比在新的进程中运行，内存峰值互不影响
+    
+    Returns:
+        {选项名称: 结果}，对比失败（如内存不足）的选项不计入
+    """
+    results = {}
+    for name in config_names:
+        options = dict(BENCHMARK_CONFIGS[name], max_items=max_items)
+        files = sum(count_files(path, options.get('recursive', True)) for path in paths)
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(_run_comparison, paths, options).result()
+        except Exception as e:
+            print(f"  {name}: 对比失败 {e!r}")
+            continue
+        result['files'] = files
+        results[name] = result
+        print(f"  {name}: {sum(wall for wall, _ in result['stages'].values()):.3f}秒")
+    return results
+
+
+def _rjust(text: str, width: int) -> str:
+    """按显示宽度右对齐，中文字符占两列"""
+    display = sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+    return ' ' * max(0, width - display) + text
+
+
+def format_results(results: Dict[str, Dict]) -> str:
+    """每组选项一行：各阶段耗时、扫描吞吐量、内存峰值和输出大小"""
+    stages = ('get_files_in_dir', '_analyze_differences', 'format_output:text', 'format_output:json')
+    header = ['扫描', '分析', '文本输出', 'JSON输出', '文件/秒', '内存峰值', '文本大小', 'JSON大小']
+    lines = ['选项'.ljust(14) + ''.join(_rjust(title, 11) for title in header)]
+    for name, result in results.items():
+        scan = result['stages']['get_files_in_dir'][0]
+        peak = result['stages']['format_output:json'][1]
+        cells = [f"{result['stages'][stage][0]:.3f}s" for stage in stages]
+        cells.append(f"{result['files'] / scan if scan else 0:.0f}")
+        cells.append(f"{peak:.1f}MB" if peak is not None else '-')
+        cells.extend(f"{size / 1024 / 1024:.2f}MB" for size in result['output_sizes'].values())
+        lines.append(name.ljust(16) + ''.join(_rjust(cell, 11) for cell in cells))
+    return "\n".join(lines)
+
+
+def find_trees(trees_dir: str) -> List[str]:
+    """按编号列出目录中生成的 tree_N 目录或清单"""
+    return [str(path) for path in sorted(Path(trees_dir).glob('tree_*'),
+                                         key=lambda path: int(path.name.split('_')[1].split('.')[0]))]
+
+
+def add_tree_arguments(parser):
+    """添加目录树生成参数"""
+    parser.add_argument('--files', type=int, default=10000,
+                       help='每棵树的文件数（默认: 10000）')
+    parser.add_argument('--trees', type=int, default=2,
+                       help='树的数量（默认: 2）')
+    parser.add_argument('--depth', type=int, default=3,
+                       help='目录嵌套层数（默认: 3）')
+    parser.add_argument('--fan-out', type=int, default=10,
+                       help='每层的子目录数（默认: 10）')
+    parser.add_argument('--pattern', choices=NAME_PATTERNS, default='asset',
+                       help='名称模式（默认: asset）')
+    parser.add_argument('--overlap', type=float, default=0.9,
+                       help='每棵树中使用基准名称的文件比例（默认: 0.9）')
+    parser.add_argument('--manifest', action='store_true',
+                       help='生成扫描清单而不是真实文件，适合百万级以上的规模')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='随机种子（默认: 0）')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='目录对比性能测试工具 - 生成合成目录树并测量扫描、分析和输出的性能',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 生成两棵各10万个文件的目录树
+  python benchmark.py generate trees --files 100000 --depth 3 --fan-out 20
+  
+  # 自动生成临时目录树并测试默认选项
+  python benchmark.py run --files 10000
+  
+  # 百万级规模使用扫描清单代替真实文件
+  python benchmark.py run --files 1000000 --manifest --configs default ignore-ext
+  
+  # 在已有目录树上对比多组选项，并保存JSON结果
+  python benchmark.py run --trees-dir trees --configs default split single-thread --json result.json
+        """
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    gen_parser = subparsers.add_parser('generate', help='生成合成目录树')
+    gen_parser.add_argument('output_dir', help='输出目录')
+    add_tree_arguments(gen_parser)
+    
+    run_parser = subparsers.add_parser('run', help='运行性能测试')
+    run_parser.add_argument('--trees-dir',
+                           help='使用已生成的目录树（不指定时按参数生成临时目录树）')
+    run_parser.add_argument('--configs', nargs='+', choices=list(BENCHMARK_CONFIGS), default=['default'],
+                           help='要测试的选项组合（默认: default）')
+    run_parser.add_argument('--max-items', type=int,
+                           help='格式化输出时每个文件列表段落最多输出的条数')
+    run_parser.add_argument('--json',
+                           help='将结果保存为JSON文件')
+    add_tree_arguments(run_parser)
+    
+    args = parser.parse_args()
+    
+    if args.command != 'generate' and args.trees_dir:
+        paths = find_trees(args.trees_dir)
+        if len(paths) < 2:
+            print(f"错误: '{args.trees_dir}' 中至少需要两个 tree_N 目录或清单")
+            return
+        temp_dir = None
+    else:
+        temp_dir = tempfile.mkdtemp(prefix='dir_compare_bench_') if args.command == 'run' else None
+        paths = generate_trees(temp_dir or args.output_dir, files=args.files, trees=args.trees,
+                               depth=args.depth, fan_out=args.fan_out, pattern=args.pattern,
+                               overlap=args.overlap, as_manifest=args.manifest, seed=args.seed)
+        if args.command == 'generate':
+            print(f"已生成 {len(paths)} 棵目录树，每棵 {args.files} 个文件: {args.output_dir}")
+            return
+    
+    try:
+        print("开始测试...")
+        results = run_benchmark(paths, args.configs, max_items=args.max_items)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,15 +7,75 @@
 - 配置多个对比路径
 - 可选择是否递归查询子目录
 - 可选择是否忽略文件扩展名
+- 可选择对比同名文件的内容（分阶段哈希）
+- 可将扫描结果保存为清单文件，并与实时目录对比或增量刷新
+- 可按文件内容识别跨目录的移动和重命名
+- 支持直接对比 zip/tar 压缩包中的文件，无需解压
+- 监视模式：基于 inotify 增量维护对比结果，只输出变化
+- 支持 gitignore 风格的排除/包含模式，遍历时直接跳过被排除的目录
+- Merkle 模式：按目录摘要跳过完全相同的子树，摘要可缓存在清单中
+- 对比键可按正则分组和模板提取，支持大小写折叠和 Unicode 规范化
+- 可按名称相似度配对各目录的独有文件，候选通过三元组倒排索引查找
 - 生成详细的对比报告
 """
 
 import os
 import argparse
+import ctypes
+import ctypes.util
+import errno
+import io
 import json
+import math
+import sys
+import gzip
+import hashlib
+import mmap
+import re
+import select
+import struct
+import tarfile
+import zipfile
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+import threading
+import time
+import unicodedata
 from pathlib import Path
-from typing import Set, List, Dict, Tuple
+from typing import Set, List, Dict, Tuple, TextIO, Iterable
 from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 内容对比时头部/尾部哈希的块大小
+HASH_BLOCK_SIZE = 64 * 1024
+# 完整哈希时每次读取的大小
+READ_BUFFER_SIZE = 1024 * 1024
+# 超过该大小的文件使用 mmap 计算完整哈希
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# 扫描结果中的文件记录: (相对目录, 文件名, 大小, 修改时间)，不需要时大小和修改时间为 None
+FileRecord = Tuple[str, str, int, float]
+
+# 扫描清单的格式标识和版本
+MANIFEST_FORMAT = 'dir_compare_manifest'
+MANIFEST_VERSION = 1
+
+# inotify 事件标志（见 <sys/inotify.h>）
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+INOTIFY_WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+# struct inotify_event 的固定部分: wd, mask, cookie, len
+INOTIFY_EVENT = struct.Struct('iIII')
+# 监视模式下合并同一批事件的等待时间（秒）
+WATCH_BATCH_DELAY = 0.2
 
 
 @dataclass
@@ -24,9 +84,382 @@ class CompareConfig:
     paths: List[str]  # 要对比的目录路径列表
     recursive: bool = True  # 是否递归查询子目录
     ignore_extension: bool = False  # 是否忽略文件扩展名
-    output_format: str = 'text'  # 输出格式: text, json
+    output_format: str = 'text'  # 输出格式: text, json, jsonl, matrix
     split_char: str = None  # 分割字符，如 '_', '-', '.'
     split_index: int = None  # 分割后要对比的下标位置
+    workers: int = 8  # 扫描目录和计算哈希时的并行线程数
+    compare_content: bool = False  # 是否对比同名文件的内容
+    max_items: int = None  # 每个文件列表段落最多输出的条数，None 表示不限制
+    omit_common: bool = False  # 是否省略所有目录都包含的文件列表
+    omit_listing: bool = False  # 是否省略 JSON 中每个目录的完整文件列表
+    detect_moves: bool = False  # 是否按内容识别移动和重命名的文件
+    exclude: List[str] = None  # gitignore 风格的排除模式
+    include: List[str] = None  # 包含模式，设置后只保留匹配的文件
+    merkle: bool = False  # 是否按目录摘要跳过完全相同的子树
+    key_pattern: str = None  # 从文件名中提取对比键的正则表达式
+    key_template: str = None  # 由正则分组组成对比键的模板，如 "{1}_{2}"、"{name}"
+    case_fold: bool = False  # 是否忽略大小写
+    unicode_normalize: str = None  # Unicode 规范化形式: NFC, NFD, NFKC, NFKD
+    fuzzy_threshold: float = None  # 名称相似度阈值 (0, 1]，设置后配对名称相近的独有文件
+
+
+class PathFilter:
+    """
+    gitignore 风格的路径过滤器，所有模式在创建时一次性编译为正则表达式
+    
+    - 不含 '/' 的模式匹配任意层级的名称，含 '/' 的模式相对于对比的根目录
+    - 以 '/' 结尾的模式只匹配目录
+    - '*' 不跨越目录，'**' 匹配任意层级，'?' 匹配单个字符，支持 [abc] 和 [!abc]
+    - '\\' 后的字符按字面匹配，'\\#'、'\\!' 用于匹配以 '#'、'!' 开头的名称
+    - 排除模式以 '!' 开头表示重新包含，与 gitignore 一样后出现的模式优先，
+      但已被排除的目录不会进入，其中的文件无法再被包含
+    - 包含模式只作用于文件：文件本身或其所在的某一级目录匹配任一包含模式时才保留
+    """
+    
+    def __init__(self, exclude: List[str] = None, include: List[str] = None):
+        self.exclude = [self._compile(pattern) for pattern in self._clean(exclude)]
+        self.include = [self._compile(pattern) for pattern in self._clean(include)]
+        # 排除模式中没有 '!' 时，顺序无关，合并为两个正则一次匹配
+        self.merged = None
+        if self.exclude and not any(negate for _, _, negate in self.exclude):
+            any_type = [regex.pattern for regex, dir_only, _ in self.exclude if not dir_only]
+            dir_only = [regex.pattern for regex, dir_only, _ in self.exclude if dir_only]
+            self.merged = (self._merge(any_type), self._merge(dir_only))
+        # 压缩包和清单中的文件需要逐级检查目录，缓存目录的判断结果
+        self._dir_cache: Dict[str, bool] = {}
+    
+    def __bool__(self):
+        return bool(self.exclude or self.include)
+    
+    @staticmethod
+    def _clean(patterns: List[str]) -> List[str]:
+        """去掉空行和 '#' 开头的注释行"""
+        return [pattern.strip() for pattern in patterns or []
+                if pattern.strip() and not pattern.startswith('#')]
+    
+    @staticmethod
+    def _merge(patterns: List[str]):
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+    
+    @staticmethod
+    def _compile(pattern: str):
+        """编译单个模式，返回 (正则, 是否只匹配目录, 是否取反)"""
+        negate = pattern.startswith('!')
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        
+        parts = []
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('**/', i):
+                parts.append('(?:.*/)?')
+                i += 3
+            elif pattern.startswith('**', i):
+                parts.append('.*')
+                i += 2
+            elif pattern[i] == '\\' and i + 1 < len(pattern):
+                parts.append(re.escape(pattern[i + 1]))
+                i += 2
+            elif pattern[i] == '*':
+                parts.append('[^/]*')
+                i += 1
+            elif pattern[i] == '?':
+                parts.append('[^/]')
+                i += 1
+            elif pattern[i] == '[' and pattern.find(']', i + 2) != -1:
+                end = pattern.find(']', i + 2)
+                body = pattern[i + 1:end].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append(f'[{body}]')
+                i = end + 1
+            else:
+                parts.append(re.escape(pattern[i]))
+                i += 1
+        
+        regex = ''.join(parts)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        return re.compile(regex), dir_only, negate
+    
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        """path 为使用 '/' 分隔的相对路径"""
+        if self.merged:
+            any_type, dir_only = self.merged
+            return bool((any_type and any_type.fullmatch(path)) or
+                        (is_dir and dir_only and dir_only.fullmatch(path)))
+        for regex, dir_only, negate in reversed(self.exclude):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path):
+                return not negate
+        return False
+    
+    def included(self, path: str) -> bool:
+        """文件或其任一级所在目录匹配包含模式"""
+        if not self.include:
+            return True
+        candidates = [path]
+        index = path.find('/')
+        while index != -1:
+            candidates.append(path[:index])
+            index = path.find('/', index + 1)
+        for regex, dir_only, _ in self.include:
+            for candidate in candidates:
+                if (not dir_only or candidate is not path) and regex.fullmatch(candidate):
+                    return True
+        return False
+    
+    def skip_file(self, path: str) -> bool:
+        """遍历目录时判断文件是否应跳过（所在目录已在进入前检查过）"""
+        return self.excluded(path, False) or not self.included(path)
+    
+    def skip_member(self, relative_dir: str, name: str) -> bool:
+        """压缩包和清单中的文件：逐级检查所在目录是否被排除，再检查文件本身"""
+        if relative_dir and self._dir_excluded(relative_dir):
+            return True
+        return self.skip_file(f"{relative_dir}/{name}" if relative_dir else name)
+    
+    def _dir_excluded(self, relative_dir: str) -> bool:
+        result = self._dir_cache.get(relative_dir)
+        if result is None:
+            parent = relative_dir.rpartition('/')[0]
+            result = (bool(parent) and self._dir_excluded(parent)) or self.excluded(relative_dir, True)
+            self._dir_cache[relative_dir] = result
+        return result
+
+
+class KeyTable:
+    """
+    对比键的紧凑存储
+    
+    每个键拆成 目录前缀 + 名称 两部分：每个不同的目录前缀只保存一份，名称通过 sys.intern
+    在所有目录间共享。键用连续的整数 ID 表示，各目录的文件集合保存为有序的 array('I')，
+    位掩码也按 ID 存放在列表中。内存随不同的路径组成部分增长，而不是随每棵树的完整路径增长，
+    完整的键字符串只在输出时临时拼出。
+    """
+    
+    def __init__(self):
+        self._prefix_ids: Dict[str, int] = {}
+        self._prefixes: List[str] = []
+        # 每个目录前缀下: 名称 -> 键 ID
+        self._names: List[Dict[str, int]] = []
+        # 键 ID -> 目录前缀 ID / 名称
+        self._key_prefixes = array('I')
+        self._key_names: List[str] = []
+        # 多个目录并行扫描时会同时登记键
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._key_names)
+    
+    def intern_many(self, keys: Iterable[str]) -> array:
+        """登记一批键，返回去重后按 ID 排序的 array('I')"""
+        ids = set()
+        with self._lock:
+            for key in keys:
+                ids.add(self._intern(key))
+        return array('I', sorted(ids))
+    
+    def intern(self, key: str) -> int:
+        with self._lock:
+            return self._intern(key)
+    
+    def _intern(self, key: str) -> int:
+        index = key.rfind(os.sep) + 1
+        prefix, name = key[:index], key[index:]
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = len(self._prefixes)
+            self._prefix_ids[prefix] = prefix_id
+            self._prefixes.append(prefix)
+            self._names.append({})
+        names = self._names[prefix_id]
+        key_id = names.get(name)
+        if key_id is None:
+            key_id = len(self._key_names)
+            name = sys.intern(name)
+            names[name] = key_id
+            self._key_prefixes.append(prefix_id)
+            self._key_names.append(name)
+        return key_id
+    
+    def key(self, key_id: int) -> str:
+        """由 ID 拼出完整的键"""
+        return self._prefixes[self._key_prefixes[key_id]] + self._key_names[key_id]
+    
+    def split(self, key_id: int) -> Tuple[int, str]:
+        """返回键的 (目录前缀 ID, 名称)"""
+        return self._key_prefixes[key_id], self._key_names[key_id]
+    
+    def sorted_ids(self, ids: Iterable[int]) -> array:
+        """按键字符串排序"""
+        return array('I', sorted(ids, key=self.key))
+
+
+class KeyList(Sequence):
+    """以键 ID 数组保存的只读键列表，读取时才拼出字符串，输出时可以当作普通列表使用"""
+    
+    def __init__(self, table: KeyTable, ids: array = None):
+        self.table = table
+        self.ids = ids if ids is not None else array('I')
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return KeyList(self.table, self.ids[index])
+        return self.table.key(self.ids[index])
+    
+    def __iter__(self):
+        key = self.table.key
+        for key_id in self.ids:
+            yield key(key_id)
+    
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+
+class KeyExtractor:
+    """
+    文件名到对比键的转换规则，创建时一次性编译，make_key 在扫描循环中直接调用
+    
+    处理顺序：Unicode 规范化 → 大小写折叠 → 忽略扩展名 → 正则提取（只作用于文件名）→
+    拼接相对目录 → 分割取下标（作用于拼接后的路径）
+    
+    正则不匹配、提取结果为空或分割下标超出范围的文件使用转换前的名称作为键，
+    只计数并保留少量示例，扫描结束后汇总输出
+    """
+    
+    NORMAL_FORMS = ('NFC', 'NFD', 'NFKC', 'NFKD')
+    # 每类提取失败保留的示例数
+    SAMPLE_LIMIT = 5
+    
+    def __init__(self, config: CompareConfig):
+        self.config = config
+        if config.unicode_normalize and config.unicode_normalize not in self.NORMAL_FORMS:
+            raise ValueError(f"不支持的 Unicode 规范化形式 '{config.unicode_normalize}'，"
+                             f"可选: {', '.join(self.NORMAL_FORMS)}")
+        if config.key_template and not config.key_pattern:
+            raise ValueError("键模板需要与键正则同时设置")
+        try:
+            self.pattern = re.compile(config.key_pattern) if config.key_pattern else None
+        except re.error as e:
+            raise ValueError(f"键正则 '{config.key_pattern}' 无效: {e}")
+        if config.key_template:
+            # 用空分组试填一次模板，提前发现引用了不存在的分组
+            try:
+                config.key_template.format('', *[''] * self.pattern.groups,
+                                           **dict.fromkeys(self.pattern.groupindex, ''))
+            except (IndexError, KeyError, ValueError) as e:
+                raise ValueError(f"键模板 '{config.key_template}' 无效: {e!r}")
+        # 提取失败的统计: 类型 -> [文件数, 示例]
+        self.fallbacks: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self.make_key = self._compile()
+    
+    def __bool__(self):
+        config = self.config
+        return bool(self.pattern or config.case_fold or config.unicode_normalize)
+    
+    def _compile(self):
+        """按配置组装键生成函数，未启用的步骤不会出现在循环中"""
+        config = self.config
+        normal_form = config.unicode_normalize
+        case_fold = config.case_fold
+        ignore_extension = config.ignore_extension
+        recursive = config.recursive
+        pattern = self.pattern
+        template = config.key_template
+        split_char = config.split_char if config.split_char and config.split_index is not None else None
+        split_index = config.split_index
+        splitext = os.path.splitext
+        normalize = unicodedata.normalize
+        fallback = self._fallback
+        
+        def clean(text):
+            if normal_form:
+                text = normalize(normal_form, text)
+            if case_fold:
+                text = text.casefold()
+            return text
+        
+        def extract(match):
+            if template:
+                return template.format(match.group(0), *match.groups(''), **match.groupdict(''))
+            # 没有模板时取第一个分组，没有分组时取整个匹配
+            return match.group(1) or '' if pattern.groups else match.group(0)
+        
+        # 同一目录下的文件共用处理后的目录前缀
+        prefixes: Dict[str, str] = {}
+        cleaning = bool(normal_form or case_fold)
+        
+        def make_key(relative_dir: str, name: str) -> str:
+            if cleaning:
+                name = clean(name)
+            if ignore_extension:
+                # 忽略扩展名，但保留路径
+                name = splitext(name)[0]
+            if pattern is not None:
+                match = pattern.search(name)
+                if match is None:
+                    fallback('unmatched', relative_dir, name)
+                else:
+                    key = extract(match)
+                    if key:
+                        name = key
+                    else:
+                        fallback('empty', relative_dir, name)
+            
+            if recursive and relative_dir:
+                prefix = prefixes.get(relative_dir)
+                if prefix is None:
+                    prefix = prefixes[relative_dir] = (clean(relative_dir) if cleaning else relative_dir) + os.sep
+                key = prefix + name
+            else:
+                key = name
+            
+            if split_char is not None:
+                parts = key.split(split_char)
+                if -len(parts) <= split_index < len(parts):
+                    return parts[split_index]
+                fallback('split', relative_dir, name)
+            return key
+        
+        return make_key
+    
+    def _fallback(self, kind: str, relative_dir: str, name: str):
+        with self._lock:
+            entry = self.fallbacks.get(kind)
+            if entry is None:
+                entry = self.fallbacks[kind] = [0, []]
+            entry[0] += 1
+            if len(entry[1]) < self.SAMPLE_LIMIT:
+                entry[1].append(relative_dir + os.sep + name if relative_dir else name)
+    
+    def counts(self) -> Dict[str, int]:
+        """各类提取失败的文件数"""
+        return {kind: entry[0] for kind, entry in self.fallbacks.items()}
+    
+    def report(self):
+        """汇总输出提取失败的文件数和示例"""
+        config = self.config
+        messages = {
+            'unmatched': f"个文件名不匹配键正则 '{config.key_pattern}'，使用原文件名作为键",
+            'empty': "个文件提取出的键为空，使用原文件名作为键",
+            'split': f"个文件按 '{config.split_char}' 分割后下标 {config.split_index} 超出范围，使用完整路径作为键",
+        }
+        for kind, (count, samples) in self.fallbacks.items():
+            print(f"警告: {count} {messages[kind]}，例如:")
+            for sample in samples:
+                print(f"  {sample}")
 
 
 class DirCompare:
@@ -34,13 +467,66 @@ class DirCompare:
     
     def __init__(self, config: CompareConfig):
         self.config = config
-        self.file_sets: Dict[str, Set[str]] = {}
+        # 所有目录共享的键表，各目录的文件集合是有序的键 ID 数组
+        self.key_table = KeyTable()
+        self.file_sets: Dict[str, array] = {}
+        # 排除/包含模式只编译一次，遍历时在进入目录前判断
+        self.path_filter = PathFilter(config.exclude, config.include)
+        self.pruned_dirs = 0
+        self.pruned_files = 0
+        self._pruned_lock = threading.Lock()
+        # 对比键的生成规则只编译一次，规则无效时抛出 ValueError
+        self.key_extractor = KeyExtractor(config)
+        self._make_key = self.key_extractor.make_key
+        if config.fuzzy_threshold is not None and not 0 < config.fuzzy_threshold <= 1:
+            raise ValueError(f"名称相似度阈值应在 0 到 1 之间，当前为 {config.fuzzy_threshold}")
+        # 每个键 ID 所在目录的位掩码，第 i 位对应 config.paths 中的第 i 个目录
+        self.presence: List[int] = []
+        # 按键字符串排序的所有键 ID
+        self.sorted_keys = array('I')
+        # 每个目录中 键 ID -> [(相对路径, 大小, 修改时间)]，只在需要文件信息时记录
+        self.file_entries: Dict[str, Dict[int, List[Tuple[str, int, float]]]] = {}
+        # 文件哈希缓存: 绝对路径 -> 哈希值
+        self.partial_hashes: Dict[str, str] = {}
+        self.full_hashes: Dict[str, str] = {}
+        # 以清单文件代替实时目录的路径
+        self.manifest_paths: Set[str] = set()
+        # 压缩包路径，以及压缩包内文件 压缩包路径/相对路径 -> 成员名
+        self.archive_paths: Set[str] = set()
+        self.archive_members: Dict[str, str] = {}
+        # CRC32 缓存: 绝对路径 -> CRC32，zip 中的文件直接使用保存的 CRC
+        self.crc_values: Dict[str, int] = {}
+    
+    def _needs_stat(self) -> bool:
+        """扫描时是否需要记录文件大小和修改时间"""
+        return self.config.compare_content or self.config.detect_moves
         
-    def get_files_in_dir(self, dir_path: str) -> Set[str]:
-        """获取目录中的所有文件名"""
-        files = set()
+    def get_files_in_dir(self, dir_path: str) -> array:
+        """获取目录中的所有文件名，返回有序的键 ID 数组"""
+        files = array('I')
+        # 结果以配置中的原始路径字符串为键
+        source = dir_path
         dir_path = Path(dir_path)
         
+        if dir_path.is_file():
+            kind = archive_type(source)
+            if kind:
+                # 压缩包：直接读取目录信息，不解压
+                try:
+                    records = self._load_archive_records(source, kind)
+                except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                    print(f"错误: 读取压缩包 '{dir_path}' 失败: {e}")
+                    return files
+                return self._build_file_set(source, records)
+            
+            # 清单文件：直接读取保存的扫描结果
+            try:
+                records = self._load_manifest_records(source)
+            except (OSError, ValueError) as e:
+                print(f"错误: 读取清单文件 '{dir_path}' 失败: {e}")
+                return files
+            return self._build_file_set(source, records)
+        
         if not dir_path.exists():
             print(f"警告: 目录 '{dir_path}' 不存在")
             return files
@@ -50,41 +536,7 @@ class DirCompare:
             return files
         
         try:
-            if self.config.recursive:
-                # 递归获取所有文件
-                for file_path in dir_path.rglob('*'):
-                    if file_path.is_file():
-                        # 计算相对路径
-                        relative_path = file_path.relative_to(dir_path)
-                        filename = str(relative_path)
-                        
-                        if self.config.ignore_extension:
-                            # 忽略扩展名，但保留路径
-                            stem = relative_path.stem
-                            parent = relative_path.parent
-                            if parent != Path('.'):
-                                filename = str(parent / stem)
-                            else:
-                                filename = stem
-                        
-                        # 处理分割字符和下标
-                        filename = self._process_split_filename(filename)
-                        
-                        files.add(filename)
-            else:
-                # 只获取当前目录下的文件
-                for item in dir_path.iterdir():
-                    if item.is_file():
-                        filename = item.name
-                        
-                        if self.config.ignore_extension:
-                            filename = item.stem
-                        
-                        # 处理分割字符和下标
-                        filename = self._process_split_filename(filename)
-                            
-                        files.add(filename)
-                        
+            files = self._build_file_set(source, self._walk_directory(source))
         except PermissionError:
             print(f"错误: 没有权限访问目录 '{dir_path}'")
         except Exception as e:
@@ -92,192 +544,1551 @@ class DirCompare:
             
         return files
     
-    def _process_split_filename(self, filename: str) -> str:
-        """根据分割字符和下标处理文件名"""
-        if not self.config.split_char or self.config.split_index is None:
-            return filename
+    def _build_file_set(self, path: str, records: List[FileRecord]) -> array:
+        """根据文件记录生成对比用的键 ID 数组，需要时同时记录文件信息"""
+        if not self._needs_stat():
+            return self.key_table.intern_many(self._make_key(relative_dir, name)
+                                              for relative_dir, name, _, _ in records)
         
-        # 分割文件名
-        parts = filename.split(self.config.split_char)
+        entries: Dict[int, List[Tuple[str, int, float]]] = {}
+        for relative_dir, name, size, mtime in records:
+            key_id = self.key_table.intern(self._make_key(relative_dir, name))
+            relative_path = relative_dir + os.sep + name if relative_dir else name
+            entries.setdefault(key_id, []).append((relative_path, size, mtime))
+        self.file_entries[path] = entries
+        return array('I', sorted(entries))
+    
+    def _load_manifest_records(self, manifest_file: str) -> List[FileRecord]:
+        """读取清单文件中的文件记录，清单中保存的哈希值会放入哈希缓存"""
+        manifest = load_manifest(manifest_file)
+        if self.config.recursive and not manifest.get('recursive', True):
+            print(f"警告: 清单 '{manifest_file}' 是非递归扫描生成的，只包含根目录文件")
         
-        try:
-            # 获取指定下标的部分
-            if self.config.split_index < 0:
-                # 支持负数下标（从末尾开始）
-                result = parts[self.config.split_index]
+        self.manifest_paths.add(manifest_file)
+        return self._directory_records(manifest_file, manifest['directories'].items())
+    
+    def _directory_records(self, source: str, directories: Iterable[Tuple[str, Dict]]) -> List[FileRecord]:
+        """
+        将清单格式的目录记录转换为文件记录，应用排除模式，记录中保存的哈希值放入哈希缓存
+        
+        Args:
+            source: 对比路径（目录或清单文件），哈希缓存以 source/相对路径 为键
+            directories: [(使用 '/' 分隔的相对目录, 目录记录)]
+        """
+        records = []
+        pruned = 0
+        for posix_dir, record in directories:
+            relative_dir = posix_dir.replace('/', os.sep)
+            if relative_dir and not self.config.recursive:
+                continue
+            for item in record['files']:
+                name, size, mtime = item[0], item[1], item[2]
+                if self.path_filter and self.path_filter.skip_member(posix_dir, name):
+                    pruned += 1
+                    continue
+                records.append((relative_dir, name, size, mtime))
+                abs_path = os.path.join(source, relative_dir, name)
+                if len(item) > 3 and item[3]:
+                    self.partial_hashes[abs_path] = item[3]
+                if len(item) > 4 and item[4]:
+                    self.full_hashes[abs_path] = item[4]
+        self._add_pruned(0, pruned)
+        return records
+    
+    def _load_archive_records(self, archive_path: str, kind: str) -> List[FileRecord]:
+        """
+        从 zip 中央目录或 tar 头部列出压缩包中的文件，zip 中保存的 CRC32 放入 CRC 缓存
+        
+        tar.gz 等压缩的 tar 包需要顺序解压一遍数据流才能读到所有头部，但不会写入磁盘
+        """
+        members = []
+        if kind == 'zip':
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        mtime = time.mktime(info.date_time + (0, 0, -1))
+                        members.append((info.filename, info.file_size, mtime, info.CRC))
+        else:
+            with tarfile.open(archive_path, 'r:*') as archive:
+                for info in archive:
+                    if info.isfile():
+                        members.append((info.name, info.size, info.mtime, None))
+        
+        self.archive_paths.add(archive_path)
+        records = []
+        pruned = 0
+        for member_name, size, mtime, crc in members:
+            relative_path = member_name.replace('\\', '/').lstrip('/')
+            if relative_path.startswith('./'):
+                relative_path = relative_path[2:]
+            relative_dir, _, name = relative_path.rpartition('/')
+            if relative_dir and not self.config.recursive:
+                continue
+            if self.path_filter and self.path_filter.skip_member(relative_dir, name):
+                pruned += 1
+                continue
+            relative_dir = relative_dir.replace('/', os.sep)
+            records.append((relative_dir, name, size, mtime))
+            abs_path = os.path.join(archive_path, relative_dir, name)
+            self.archive_members[abs_path] = member_name
+            if crc is not None:
+                self.crc_values[abs_path] = crc
+        self._add_pruned(0, pruned)
+        return records
+    
+    def _add_pruned(self, dirs: int, files: int):
+        """累加被排除的目录和文件数，扫描线程会并发调用"""
+        if dirs or files:
+            with self._pruned_lock:
+                self.pruned_dirs += dirs
+                self.pruned_files += files
+    
+    def build_manifest(self, root: str, previous: Dict = None, with_hashes: bool = False) -> Dict:
+        """
+        扫描目录生成清单
+        
+        Args:
+            root: 要扫描的目录
+            previous: 之前的清单，提供时只重新扫描修改时间发生变化的目录
+            with_hashes: 是否在清单中保存文件哈希
+        """
+        # 哈希缓存与对比时一样以传入的路径拼写为键，同一个文件只缓存一份
+        source = root
+        root = os.path.abspath(root)
+        previous_dirs = {}
+        if previous:
+            if previous.get('root') != root or previous.get('recursive') != self.config.recursive:
+                print("警告: 已有清单与本次扫描的目录或递归设置不一致，将完整扫描")
             else:
-                result = parts[self.config.split_index]
-            return result
-        except IndexError:
-            # 如果下标超出范围，返回原文件名并显示警告
-            print(f"警告: 文件 '{filename}' 按 '{self.config.split_char}' 分割后，下标 {self.config.split_index} 超出范围")
-            return filename
+                previous_dirs = {rel.replace('/', os.sep): record
+                                 for rel, record in previous['directories'].items()}
+        # 复用和重新扫描的目录（list.append 在多线程下是安全的）
+        reused, rescanned = [], []
+        
+        def scan(abs_dir, relative_dir):
+            """扫描单个目录，目录修改时间未变时直接复用旧记录"""
+            dir_mtime = os.stat(abs_dir).st_mtime
+            old = previous_dirs.get(relative_dir)
+            if old is not None and old['mtime'] == dir_mtime:
+                reused.append(relative_dir)
+                subdirs = [(os.path.join(abs_dir, name),
+                            relative_dir + os.sep + name if relative_dir else name)
+                           for name in old['dirs']]
+                return [(relative_dir, old)], subdirs
+            
+            rescanned.append(relative_dir)
+            files, subdirs = self._scan_one_directory(abs_dir, relative_dir, need_stat=True)
+            # 大小和修改时间都未变的文件沿用旧的哈希
+            old_files = {item[0]: item for item in old['files']} if old else {}
+            items = []
+            for _, name, size, mtime in files:
+                item = [name, size, mtime]
+                old_item = old_files.get(name)
+                if old_item and old_item[1] == size and old_item[2] == mtime:
+                    item.extend(old_item[3:])
+                items.append(item)
+            record = {
+                'mtime': dir_mtime,
+                'dirs': sorted(os.path.basename(abs_sub) for abs_sub, _ in subdirs),
+                'files': sorted(items)
+            }
+            return [(relative_dir, record)], subdirs
+        
+        directories = dict(self._walk_directory(root, scan))
+        
+        if with_hashes:
+            files = []
+            for relative_dir, record in directories.items():
+                for item in record['files']:
+                    if len(item) < 5:
+                        files.append((item, os.path.join(source, relative_dir, item[0])))
+            self._hash_files([(abs_path, item[1]) for item, abs_path in files], partial=True)
+            self._hash_files([(abs_path, item[1]) for item, abs_path in files
+                              if item[1] > 2 * HASH_BLOCK_SIZE], partial=False)
+            for item, abs_path in files:
+                # 头尾块已覆盖整个文件时完整哈希留空
+                del item[3:]
+                item.extend([self.partial_hashes[abs_path], self.full_hashes.get(abs_path)])
+        
+        if previous_dirs:
+            print(f"增量刷新: 复用 {len(reused)} 个目录，重新扫描 {len(rescanned)} 个目录")
+        
+        directories = {rel.replace(os.sep, '/'): record for rel, record in sorted(directories.items())}
+        # 目录摘要随清单保存，Merkle 模式对比清单时无需重新计算
+        compute_digests(directories, use_hashes=False)
+        if with_hashes:
+            compute_digests(directories, use_hashes=True)
+        return {
+            'format': MANIFEST_FORMAT,
+            'version': MANIFEST_VERSION,
+            'root': root,
+            'recursive': self.config.recursive,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'directories': directories
+        }
+    
+    def _scan_one_directory(self, abs_dir: str, relative_dir: str, need_stat: bool = None) -> Tuple[List[FileRecord], List[Tuple[str, str]]]:
+        """
+        扫描单个目录（不递归）
+        
+        使用 os.scandir，文件类型直接取自 DirEntry，只有需要大小和修改时间时才调用 stat
+        
+        Returns:
+            (文件列表 [FileRecord], 子目录列表 [(绝对路径, 相对路径)])
+        """
+        files = []
+        subdirs = []
+        if need_stat is None:
+            need_stat = self._needs_stat()
+        path_filter = self.path_filter if self.path_filter else None
+        # 过滤模式使用 '/' 分隔的相对路径
+        posix_prefix = relative_dir.replace(os.sep, '/') + '/' if relative_dir else ''
+        pruned_dirs = pruned_files = 0
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    try:
+                        # 与 Path.rglob 一致：不进入指向目录的符号链接
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.config.recursive:
+                                if path_filter and path_filter.excluded(posix_prefix + entry.name, True):
+                                    # 被排除的目录不会被打开
+                                    pruned_dirs += 1
+                                    continue
+                                sub_relative = relative_dir + os.sep + entry.name if relative_dir else entry.name
+                                subdirs.append((entry.path, sub_relative))
+                        elif entry.is_file():
+                            if path_filter and path_filter.skip_file(posix_prefix + entry.name):
+                                pruned_files += 1
+                                continue
+                            if need_stat:
+                                stat = entry.stat()
+                                files.append((relative_dir, entry.name, stat.st_size, stat.st_mtime))
+                            else:
+                                files.append((relative_dir, entry.name, None, None))
+                    except OSError:
+                        continue
+        except PermissionError:
+            if not relative_dir:
+                raise
+            print(f"错误: 没有权限访问目录 '{abs_dir}'")
+        except OSError as e:
+            if not relative_dir:
+                raise
+            print(f"错误: 读取目录 '{abs_dir}' 时发生异常: {e}")
+        self._add_pruned(pruned_dirs, pruned_files)
+        return files, subdirs
+    
+    def _walk_directory(self, root: str, scan=None) -> List:
+        """
+        使用线程池并行遍历目录树
+        
+        Args:
+            root: 根目录
+            scan: 单目录扫描函数 (绝对路径, 相对路径) -> (结果列表, 子目录列表)，
+                  默认为 _scan_one_directory，返回所有文件的记录
+        """
+        scan = scan or self._scan_one_directory
+        root_files, subdirs = scan(root, '')
+        results = root_files
+        if not subdirs:
+            return results
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.config.workers)) as executor:
+            pending = {executor.submit(scan, abs_dir, rel_dir)
+                       for abs_dir, rel_dir in subdirs}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirs = future.result()
+                    results.extend(files)
+                    for abs_dir, rel_dir in subdirs:
+                        pending.add(executor.submit(scan, abs_dir, rel_dir))
+        return results
     
     def compare_directories(self) -> Dict:
         """执行目录对比"""
         print("开始扫描目录...")
         
-        # 获取每个目录的文件集合
+        identical = self._merkle_scan() if self._merkle_enabled() else None
+        if identical is None:
+            # 并行扫描所有目录，按配置顺序保存结果
+            with ThreadPoolExecutor(max_workers=max(1, len(self.config.paths))) as executor:
+                futures = [executor.submit(self.get_files_in_dir, path) for path in self.config.paths]
+                for path, future in zip(self.config.paths, futures):
+                    self.file_sets[path] = future.result()
+        
+        skipped = sum(count for _, count in identical) if identical else 0
         for path in self.config.paths:
             print(f"扫描目录: {path}")
-            self.file_sets[path] = self.get_files_in_dir(path)
-            print(f"  找到 {len(self.file_sets[path])} 个文件")
+            print(f"  找到 {len(self.file_sets[path]) + skipped} 个文件")
+        self.key_extractor.report()
         
         # 计算对比结果
         result = self._analyze_differences()
+        if identical is not None and "error" not in result:
+            self._add_identical_subtrees(result, identical)
+        
+        # 对比同名文件的内容
+        if self.config.compare_content and "error" not in result:
+            print("正在对比文件内容...")
+            result["content"] = self._compare_contents()
+            result["summary"]["different_content_count"] = len(result["content"]["different_files"])
+        
+        # 识别移动和重命名
+        if self.config.detect_moves and "error" not in result:
+            print("正在识别移动和重命名的文件...")
+            result["moves"] = self._detect_moves()
+            result["summary"]["moved_files_count"] = len(result["moves"])
+        
+        # 按名称相似度配对独有文件
+        if self.config.fuzzy_threshold is not None and "error" not in result:
+            print("正在查找名称相近的文件...")
+            result["similar_files"] = self._match_similar_names(result.get("moves", []))
+            result["summary"]["similar_files_count"] = len(result["similar_files"])
+        return result
+    
+    def _merkle_enabled(self) -> bool:
+        """Merkle 模式只适用于递归对比目录或清单"""
+        if not self.config.merkle:
+            return False
+        if not self.config.recursive:
+            print("警告: 非递归模式下不使用 Merkle 对比")
+            return False
+        if self.config.split_char and self.config.split_index is not None:
+            print("警告: 分割对比时不同目录下的文件可能对应同一个键，不使用 Merkle 对比")
+            return False
+        if any(os.path.isfile(path) and archive_type(path) for path in self.config.paths):
+            print("警告: 压缩包没有目录摘要，不使用 Merkle 对比")
+            return False
+        return True
+    
+    def _load_tree(self, path: str) -> Dict[str, Dict]:
+        """读取或扫描一个对比路径，返回带目录摘要的清单目录记录"""
+        use_hashes = self.config.compare_content
+        if os.path.isfile(path):
+            manifest = load_manifest(path)
+            self.manifest_paths.add(path)
+            directories = manifest['directories']
+            digest_key = 'content_digest' if use_hashes else 'digest'
+            # 清单中缓存了摘要时直接使用；设置了排除模式时需要按过滤后的内容重新计算
+            if self.path_filter or any(digest_key not in record for record in directories.values()):
+                if self.path_filter:
+                    directories = self._filter_tree(directories)
+                if use_hashes and not compute_digests(directories, use_hashes=True):
+                    print(f"警告: 清单 '{path}' 中缺少文件哈希，这些文件按大小和修改时间计算摘要")
+                if not use_hashes:
+                    compute_digests(directories, use_hashes=False)
+            return directories
+        
+        if not os.path.isdir(path):
+            print(f"警告: 目录 '{path}' 不存在")
+            return {}
+        # 内容模式下需要文件哈希才能计算内容摘要
+        return self.build_manifest(path, with_hashes=use_hashes)['directories']
+    
+    def _filter_tree(self, directories: Dict[str, Dict]) -> Dict[str, Dict]:
+        """按排除/包含模式过滤清单目录记录"""
+        path_filter = self.path_filter
+        result = {}
+        for posix_dir, record in directories.items():
+            if posix_dir and path_filter._dir_excluded(posix_dir):
+                continue
+            prefix = posix_dir + '/' if posix_dir else ''
+            result[posix_dir] = {
+                'dirs': [name for name in record['dirs'] if not path_filter.excluded(prefix + name, True)],
+                'files': [item for item in record['files'] if not path_filter.skip_file(prefix + item[0])]
+            }
         return result
     
+    def _merkle_scan(self) -> List[Tuple[str, int]]:
+        """
+        Merkle 模式扫描：从根目录开始比较各路径的目录摘要，摘要全部相同的子树直接跳过，
+        只把摘要不同的目录中的文件登记到文件集合
+        
+        Returns:
+            跳过的相同子树 [(相对目录, 文件数)]
+        """
+        paths = self.config.paths
+        with ThreadPoolExecutor(max_workers=max(1, len(paths))) as executor:
+            futures = [executor.submit(self._load_tree, path) for path in paths]
+            trees = []
+            for path, future in zip(paths, futures):
+                try:
+                    trees.append(future.result())
+                except (OSError, ValueError) as e:
+                    print(f"错误: 读取 '{path}' 失败: {e}")
+                    trees.append({})
+        
+        digest_key = 'content_digest' if self.config.compare_content else 'digest'
+        identical = []
+        selected: List[List[Tuple[str, Dict]]] = [[] for _ in paths]
+        stack = ['']
+        while stack:
+            posix_dir = stack.pop()
+            records = [tree.get(posix_dir) for tree in trees]
+            if all(records) and len({record.get(digest_key) for record in records}) == 1 \
+                    and records[0].get(digest_key):
+                identical.append((posix_dir, records[0]['count']))
+                continue
+            children = set()
+            for index, record in enumerate(records):
+                if record is not None:
+                    selected[index].append((posix_dir, record))
+                    children.update(record['dirs'])
+            prefix = posix_dir + '/' if posix_dir else ''
+            stack.extend(prefix + name for name in children)
+        
+        for index, path in enumerate(paths):
+            self.file_sets[path] = self._build_file_set(path, self._directory_records(path, selected[index]))
+        return sorted(identical)
+    
+    def _add_identical_subtrees(self, result: Dict, identical: List[Tuple[str, int]]):
+        """把跳过的相同子树计入结果：这些文件在所有目录中都存在且相同，只计数不列出"""
+        skipped = sum(count for _, count in identical)
+        summary = result["summary"]
+        summary["identical_subtrees"] = len(identical)
+        summary["skipped_files"] = skipped
+        summary["total_unique_files"] += skipped
+        summary["common_files_count"] += skipped
+        for info in result["directories"].values():
+            info["file_count"] += skipped
+        result["identical_subtrees"] = [{"directory": (posix_dir or '.').replace('/', os.sep), "files": count}
+                                        for posix_dir, count in identical]
+    
+    def _detect_moves(self) -> List[Dict]:
+        """
+        在每两个目录之间，按内容配对"一侧有、另一侧没有"的文件，识别移动和重命名
+        
+        与内容对比相同，先按大小筛选，再计算头尾哈希，最后只对大文件计算完整哈希；
+        哈希结果缓存在实例中，同一个文件在多次配对中只读取一次。空文件不参与配对。
+        """
+        paths = list(self.file_sets.keys())
+        moves = []
+        
+        def side_files(path, other_bit):
+            """path 中存在、另一个目录中不存在的文件 [(键, 相对路径, 绝对路径, 大小)]"""
+            result = []
+            for key_id, entries in self.file_entries.get(path, {}).items():
+                if self.presence[key_id] & other_bit:
+                    continue
+                key = self.key_table.key(key_id)
+                for relative_path, size, _ in entries:
+                    if size:
+                        result.append((key, relative_path, os.path.join(path, relative_path), size))
+            return result
+        
+        def readable(files, path):
+            if path in self.manifest_paths or path in self.archive_paths:
+                return []
+            return [(abs_path, size) for _, _, abs_path, size in files]
+        
+        def fingerprint(abs_path, size):
+            if size <= 2 * HASH_BLOCK_SIZE:
+                return size, self.partial_hashes.get(abs_path)
+            return size, self.full_hashes.get(abs_path)
+        
+        for i, path_a in enumerate(paths):
+            for j in range(i + 1, len(paths)):
+                path_b = paths[j]
+                files_a = side_files(path_a, 1 << j)
+                files_b = side_files(path_b, 1 << i)
+                
+                # 阶段1: 只保留两侧都出现过的大小
+                sizes = {item[3] for item in files_a} & {item[3] for item in files_b}
+                files_a = [item for item in files_a if item[3] in sizes]
+                files_b = [item for item in files_b if item[3] in sizes]
+                if not files_a or not files_b:
+                    continue
+                
+                # 阶段2: 头尾哈希
+                self._hash_files(readable(files_a, path_a) + readable(files_b, path_b), partial=True)
+                heads = ({(item[3], self.partial_hashes.get(item[2])) for item in files_a} &
+                         {(item[3], self.partial_hashes.get(item[2])) for item in files_b})
+                files_a = [item for item in files_a if (item[3], self.partial_hashes.get(item[2])) in heads]
+                files_b = [item for item in files_b if (item[3], self.partial_hashes.get(item[2])) in heads]
+                
+                # 阶段3: 大文件的完整哈希
+                self._hash_files([(abs_path, size) for abs_path, size in
+                                  readable(files_a, path_a) + readable(files_b, path_b)
+                                  if size > 2 * HASH_BLOCK_SIZE], partial=False)
+                
+                # 按内容一对一配对，内容相同的多个文件按路径顺序依次配对
+                targets: Dict[Tuple, List] = {}
+                for item in sorted(files_b):
+                    value = fingerprint(item[2], item[3])
+                    if value[1] is not None and not value[1].startswith('error:'):
+                        targets.setdefault(value, []).append(item)
+                for key, relative_path, abs_path, size in sorted(files_a):
+                    candidates = targets.get(fingerprint(abs_path, size))
+                    if not candidates:
+                        continue
+                    target_key, target_path, _, _ = candidates.pop(0)
+                    if os.path.dirname(relative_path) == os.path.dirname(target_path):
+                        move_type = "rename"
+                    elif os.path.basename(relative_path) == os.path.basename(target_path):
+                        move_type = "move"
+                    else:
+                        move_type = "move_rename"
+                    moves.append({
+                        "kind": move_type,
+                        "from_dir": path_a,
+                        "from": key,
+                        "to_dir": path_b,
+                        "to": target_key,
+                        "size": size
+                    })
+        return moves
+    
+    def _match_similar_names(self, moves: List[Dict]) -> List[Dict]:
+        """
+        在每两个目录之间，按名称相似度配对"一侧有、另一侧没有"的文件
+        
+        相似度为文件名（忽略大小写）三元组集合的 Dice 系数，只在同一目录前缀下配对。
+        候选通过前缀过滤查找：三元组按两侧合计的出现次数从少到多排序，名称按三元组数从少到多处理。
+        三元组数为 m ≤ n 的两个名称相似度达到阈值 t 时至少共享 t·m 个、也至少共享 t·n/(2-t) 个三元组，
+        因此较短名称最少见的 m - t·m + 1 个三元组与较长名称最少见的 n - t·n/(2-t) + 1 个三元组中必有一个相同。
+        每个名称先用后一种前缀查找另一侧已登记的名称，再把前一种（更短的）前缀登记到倒排索引，
+        常见的三元组几乎不会进入索引，候选数量远小于全部两两比较。
+        候选按相似度从高到低一对一配对，已识别为移动或重命名的文件不再参与。
+        """
+        threshold = self.config.fuzzy_threshold
+        table = self.key_table
+        paths = list(self.file_sets.keys())
+        moved = {(move["from_dir"], move["from"]) for move in moves} | \
+                {(move["to_dir"], move["to"]) for move in moves}
+        grams_cache: Dict[int, Tuple[int, Set[str]]] = {}
+        # 计算最少共享数时去掉浮点误差，避免前缀被算短
+        epsilon = 1e-9
+        
+        def grams(key_id):
+            """名称的 (目录前缀 ID, 三元组集合)，首尾补空格使开头和结尾的字符也有权重"""
+            value = grams_cache.get(key_id)
+            if value is None:
+                prefix_id, name = table.split(key_id)
+                text = f"  {name.casefold()} "
+                value = grams_cache[key_id] = (prefix_id, {text[k:k + 3] for k in range(len(text) - 2)})
+            return value
+        
+        def side_ids(path, other_bit):
+            """path 中存在、另一个目录中不存在的键 ID"""
+            ids = [key_id for key_id in self.file_sets[path] if not self.presence[key_id] & other_bit]
+            if moved:
+                ids = [key_id for key_id in ids if (path, table.key(key_id)) not in moved]
+            return ids
+        
+        matches = []
+        for i, path_a in enumerate(paths):
+            for j in range(i + 1, len(paths)):
+                path_b = paths[j]
+                ids_a = side_ids(path_a, 1 << j)
+                ids_b = side_ids(path_b, 1 << i)
+                if not ids_a or not ids_b:
+                    continue
+                
+                # 两侧合计的三元组出现次数，决定前缀的排序
+                frequency = Counter()
+                gram_sets: Dict[int, Set[str]] = {}
+                for key_id in ids_a + ids_b:
+                    prefix_id, gram_set = grams(key_id)
+                    gram_sets[key_id] = gram_set
+                    frequency.update((prefix_id, gram) for gram in gram_set)
+                
+                # 两侧各自的倒排索引: (目录前缀 ID, 三元组) -> 键 ID 列表
+                indexes: Tuple[Dict, Dict] = ({}, {})
+                records = sorted([(len(gram_sets[key_id]), 0, key_id) for key_id in ids_a] +
+                                 [(len(gram_sets[key_id]), 1, key_id) for key_id in ids_b])
+                candidates = []
+                for size, side, key_id in records:
+                    prefix_id, gram_set = grams(key_id)
+                    ordered = sorted(((prefix_id, gram) for gram in gram_set),
+                                     key=lambda item: (frequency[item], item))
+                    # 与已登记的（不长于自身的）名称配对
+                    low = threshold * size / (2 - threshold) - epsilon
+                    probe = size - math.ceil(low) + 1
+                    index = indexes[1 - side]
+                    seen = set()
+                    for item in ordered[:probe]:
+                        posting = index.get(item)
+                        if posting:
+                            seen.update(posting)
+                    for other_id in seen:
+                        other = gram_sets[other_id]
+                        if len(other) < low:
+                            continue
+                        score = 2 * len(gram_set & other) / (size + len(other))
+                        if score >= threshold:
+                            candidates.append((score, key_id, other_id) if side == 0 else (score, other_id, key_id))
+                    # 登记自身前缀，供之后更长的名称查找
+                    own = indexes[side]
+                    for item in ordered[:size - math.ceil(threshold * size - epsilon) + 1]:
+                        own.setdefault(item, []).append(key_id)
+                
+                # 按相似度从高到低一对一配对，相同相似度按名称排序保证结果稳定
+                candidates.sort(key=lambda item: (-item[0], table.key(item[1]), table.key(item[2])))
+                used_a, used_b = set(), set()
+                for score, key_a, key_b in candidates:
+                    if key_a in used_a or key_b in used_b:
+                        continue
+                    used_a.add(key_a)
+                    used_b.add(key_b)
+                    matches.append({
+                        "from_dir": path_a,
+                        "from": table.key(key_a),
+                        "to_dir": path_b,
+                        "to": table.key(key_b),
+                        "similarity": round(score, 3)
+                    })
+        return matches
+    
+    def _hash_file(self, abs_path: str, size: int, partial: bool) -> str:
+        """
+        计算文件哈希
+        
+        Args:
+            abs_path: 文件路径
+            size: 文件大小
+            partial: 为 True 时只哈希头部和尾部各一个块
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(abs_path, 'rb') as f:
+            if partial:
+                digest.update(f.read(HASH_BLOCK_SIZE))
+                if size > HASH_BLOCK_SIZE:
+                    f.seek(max(HASH_BLOCK_SIZE, size - HASH_BLOCK_SIZE))
+                    digest.update(f.read(HASH_BLOCK_SIZE))
+            elif size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+            else:
+                for chunk in iter(lambda: f.read(READ_BUFFER_SIZE), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _hash_files(self, files: List[Tuple[str, int]], partial: bool) -> int:
+        """
+        使用线程池计算一批文件的哈希，结果写入缓存，已缓存的文件不会重复读取
+        
+        Returns:
+            读取失败的文件数
+        """
+        cache = self.partial_hashes if partial else self.full_hashes
+        todo = {abs_path: size for abs_path, size in files if abs_path not in cache}
+        errors = 0
+        
+        def hash_one(item):
+            abs_path, size = item
+            try:
+                return abs_path, self._hash_file(abs_path, size, partial)
+            except OSError:
+                return abs_path, None
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.config.workers)) as executor:
+            for abs_path, value in executor.map(hash_one, todo.items()):
+                if value is None:
+                    errors += 1
+                    # 读取失败的文件使用唯一的值，保证不会与其他文件相同
+                    value = f'error:{abs_path}'
+                cache[abs_path] = value
+        return errors
+    
+    def _crc_files(self, files: List[str]) -> int:
+        """
+        计算一批文件的 CRC32，结果写入缓存；tar 包中的文件按压缩包分组，每个压缩包顺序读取一遍
+        
+        Returns:
+            读取失败的文件数
+        """
+        todo = [abs_path for abs_path in dict.fromkeys(files) if abs_path not in self.crc_values]
+        in_tar: Dict[str, Dict[str, str]] = {}
+        on_disk = []
+        for abs_path in todo:
+            archive_path = next((path for path in self.archive_paths
+                                 if abs_path.startswith(path + os.sep)), None)
+            if archive_path:
+                in_tar.setdefault(archive_path, {})[self.archive_members[abs_path]] = abs_path
+            else:
+                on_disk.append(abs_path)
+        
+        def crc_stream(f):
+            value = 0
+            for chunk in iter(lambda: f.read(READ_BUFFER_SIZE), b''):
+                value = zlib.crc32(chunk, value)
+            return value
+        
+        def crc_one(abs_path):
+            try:
+                with open(abs_path, 'rb') as f:
+                    return abs_path, crc_stream(f)
+            except OSError:
+                return abs_path, None
+        
+        def crc_archive(item):
+            archive_path, wanted = item
+            values = {}
+            try:
+                with tarfile.open(archive_path, 'r:*') as archive:
+                    for info in archive:
+                        if info.name in wanted:
+                            values[wanted[info.name]] = crc_stream(archive.extractfile(info))
+            except (OSError, tarfile.TarError):
+                pass
+            return [(abs_path, values.get(abs_path)) for abs_path in wanted.values()]
+        
+        errors = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.config.workers)) as executor:
+            results = list(executor.map(crc_one, on_disk))
+            for items in executor.map(crc_archive, in_tar.items()):
+                results.extend(items)
+        for abs_path, value in results:
+            if value is None:
+                errors += 1
+                # 读取失败时使用唯一的值，保证不会与其他文件相同
+                value = f'error:{abs_path}'
+            self.crc_values[abs_path] = value
+        return errors
+    
+    def _compare_contents(self) -> Dict:
+        """
+        分阶段对比至少两个目录中都存在的同名文件
+        
+        1. 对比文件大小，大小不同的直接判定为不同
+        2. 对剩余文件计算头部和尾部块的哈希
+        3. 只对仍无法区分且大于两个块的文件计算完整哈希
+        
+        涉及压缩包的文件改为对比 CRC32：zip 使用中央目录中保存的值，只有另一侧的文件需要计算
+        """
+        paths = list(self.file_sets.keys())
+        # 位掩码中至少有两位为 1 的键
+        candidates = [key_id for key_id, mask in enumerate(self.presence) if mask & (mask - 1)]
+        
+        def files_of(key):
+            """[(目录, 绝对路径, 大小)]，清单中的文件使用 清单路径/相对路径 作为缓存键"""
+            result = []
+            for path in paths:
+                for relative_path, size, _ in self.file_entries.get(path, {}).get(key, []):
+                    result.append((path, os.path.join(path, relative_path), size))
+            return result
+        
+        def readable_files(keys):
+            """需要计算哈希的文件，清单中的文件无法读取，只能使用清单保存的哈希"""
+            return [(abs_path, size) for key in keys for path, abs_path, size in files_of(key)
+                    if path not in self.manifest_paths and path not in self.archive_paths]
+        
+        def is_same(key, signature):
+            """各目录中该键对应文件的签名是否全部相同，缺少签名时返回 None"""
+            per_dir: Dict[str, List] = {}
+            for path, abs_path, size in files_of(key):
+                value = signature(abs_path, size)
+                if value is None:
+                    return None
+                per_dir.setdefault(path, []).append(value)
+            values = [sorted(items) for items in per_dir.values()]
+            return all(value == values[0] for value in values[1:])
+        
+        different = []
+        # 清单中没有哈希、只能确认大小相同的文件
+        unverified = []
+        
+        # 阶段1: 文件大小
+        remaining = []
+        for key in candidates:
+            if is_same(key, lambda abs_path, size: size):
+                remaining.append(key)
+            else:
+                different.append(key)
+        
+        # 涉及压缩包的文件对比 CRC32，清单中的文件没有 CRC，无法确认
+        if self.archive_paths:
+            archive_keys = [key for key in remaining
+                            if any(path in self.archive_paths for path, _, _ in files_of(key))]
+            remaining = [key for key in remaining if key not in set(archive_keys)]
+            errors = self._crc_files([abs_path for key in archive_keys
+                                      for path, abs_path, _ in files_of(key)
+                                      if path not in self.manifest_paths])
+            for key in archive_keys:
+                same = is_same(key, lambda abs_path, size: self.crc_values.get(abs_path))
+                if same is None:
+                    unverified.append(key)
+                elif not same:
+                    different.append(key)
+        else:
+            errors = 0
+        
+        # 阶段2: 头部和尾部哈希
+        errors += self._hash_files(readable_files(remaining), partial=True)
+        ambiguous = []
+        for key in remaining:
+            same = is_same(key, lambda abs_path, size: self.partial_hashes.get(abs_path))
+            if same is None:
+                unverified.append(key)
+            elif not same:
+                different.append(key)
+            elif any(size > 2 * HASH_BLOCK_SIZE for _, _, size in files_of(key)):
+                ambiguous.append(key)
+        
+        # 阶段3: 完整哈希（头尾块已覆盖整个文件的小文件不需要）
+        errors += self._hash_files([(abs_path, size) for abs_path, size in readable_files(ambiguous)
+                                    if size > 2 * HASH_BLOCK_SIZE], partial=False)
+        
+        def full_signature(abs_path, size):
+            if size <= 2 * HASH_BLOCK_SIZE:
+                return self.partial_hashes.get(abs_path)
+            return self.full_hashes.get(abs_path)
+        
+        for key in ambiguous:
+            same = is_same(key, full_signature)
+            if same is None:
+                unverified.append(key)
+            elif not same:
+                different.append(key)
+        
+        if errors:
+            print(f"警告: {errors} 个文件读取失败，已视为内容不同")
+        if unverified:
+            print(f"警告: {len(unverified)} 个同名文件缺少清单哈希或 CRC，只确认了大小相同")
+        
+        return {
+            "compared_files": len(candidates),
+            "different_files": sorted(self.key_table.key(key_id) for key_id in different),
+            "unverified_files": sorted(self.key_table.key(key_id) for key_id in unverified),
+            "partial_hashed": len(self.partial_hashes),
+            "full_hashed": len(self.full_hashes),
+            "crc_checked": len(self.crc_values)
+        }
+    
     def _analyze_differences(self) -> Dict:
-        """分析文件差异"""
+        """
+        分析文件差异
+        
+        一次遍历为每个键计算所在目录的位掩码，共同、独有和缺失文件都由位掩码推出，
+        时间复杂度与目录数呈线性关系
+        """
         paths = list(self.file_sets.keys())
         
         if len(paths) < 2:
             return {"error": "至少需要两个目录进行对比"}
         
-        # 计算交集和差集
-        all_files = set()
-        for files in self.file_sets.values():
-            all_files.update(files)
+        presence = [0] * len(self.key_table)
+        for index, path in enumerate(paths):
+            bit = 1 << index
+            for key_id in self.file_sets[path]:
+                presence[key_id] |= bit
+        self.presence = presence
+        self.sorted_keys = self.key_table.sorted_ids(key_id for key_id, mask in enumerate(presence) if mask)
         
+        # 按排序后的顺序遍历一次，逐位分发到各 ID 数组，结果天然有序
+        full_mask = (1 << len(paths)) - 1
+        common = array('I')
+        unique = [array('I') for _ in paths]
+        missing = [array('I') for _ in paths]
+        for key_id in self.sorted_keys:
+            mask = presence[key_id]
+            if mask == full_mask:
+                common.append(key_id)
+                continue
+            if not mask & (mask - 1):
+                unique[mask.bit_length() - 1].append(key_id)
+            absent = full_mask ^ mask
+            while absent:
+                lowest = absent & -absent
+                missing[lowest.bit_length() - 1].append(key_id)
+                absent ^= lowest
+        
+        table = self.key_table
         result = {
             "config": asdict(self.config),
             "summary": {
                 "total_directories": len(paths),
-                "total_unique_files": len(all_files)
+                "total_unique_files": len(self.sorted_keys)
             },
             "directories": {},
-            "common_files": set(),
+            "common_files": KeyList(table, common),
             "unique_files": {},
             "missing_files": {}
         }
         
-        # 记录每个目录的信息
-        for path in paths:
-            result["directories"][path] = {
-                "file_count": len(self.file_sets[path]),
-                "files": sorted(list(self.file_sets[path]))
-            }
+        # 每个目录的完整文件列表按键的排序位置排列，与其他段落的顺序一致；省略列表时不构建
+        listing = not self.config.omit_listing
+        if listing:
+            rank = array('I', bytes(4 * len(table)))
+            for position, key_id in enumerate(self.sorted_keys):
+                rank[key_id] = position
         
-        # 计算所有目录都有的文件（交集）
-        if len(paths) >= 2:
-            common_files = self.file_sets[paths[0]]
-            for path in paths[1:]:
-                common_files = common_files.intersection(self.file_sets[path])
-            result["common_files"] = sorted(list(common_files))
-        
-        # 计算每个目录独有的文件
-        for path in paths:
-            other_files = set()
-            for other_path in paths:
-                if other_path != path:
-                    other_files.update(self.file_sets[other_path])
-            
-            unique = self.file_sets[path] - other_files
-            result["unique_files"][path] = sorted(list(unique))
-        
-        # 计算每个目录缺失的文件（其他目录有但当前目录没有的）
-        for path in paths:
-            other_files = set()
-            for other_path in paths:
-                if other_path != path:
-                    other_files.update(self.file_sets[other_path])
-            
-            missing = other_files - self.file_sets[path]
-            result["missing_files"][path] = sorted(list(missing))
+        for index, path in enumerate(paths):
+            result["directories"][path] = {"file_count": len(self.file_sets[path])}
+            if listing:
+                result["directories"][path]["files"] = KeyList(
+                    table, array('I', sorted(self.file_sets[path], key=rank.__getitem__)))
+            result["unique_files"][path] = KeyList(table, unique[index])
+            result["missing_files"][path] = KeyList(table, missing[index])
         
         result["summary"]["common_files_count"] = len(result["common_files"])
+        if self.path_filter:
+            result["summary"]["pruned_directories"] = self.pruned_dirs
+            result["summary"]["pruned_files"] = self.pruned_files
+        if self.key_extractor.fallbacks:
+            result["summary"]["key_fallbacks"] = self.key_extractor.counts()
         
         return result
     
     def format_output(self, result: Dict) -> str:
         """格式化输出结果"""
+        buffer = io.StringIO()
+        self.write_output(result, buffer)
+        return buffer.getvalue().rstrip("\n")
+    
+    def write_output(self, result: Dict, out: TextIO):
+        """
+        将结果逐段写入文件对象，不在内存中拼接完整报告
+        
+        Args:
+            result: compare_directories 的结果
+            out: 可写的文本文件对象，如 sys.stdout
+        """
         if self.config.output_format == 'json':
-            # 转换 set 为 list 以便 JSON 序列化
-            json_result = self._convert_sets_to_lists(result)
-            return json.dumps(json_result, ensure_ascii=False, indent=2)
+            self._write_json_value(out, self._limit_sections(result), 0)
+            out.write("\n")
+        elif self.config.output_format == 'jsonl':
+            self._write_jsonl_output(result, out)
+        elif self.config.output_format == 'matrix':
+            self._write_matrix_output(result, out)
         else:
-            return self._format_text_output(result)
-    
-    def _convert_sets_to_lists(self, obj):
-        """递归转换集合为列表以便JSON序列化"""
-        if isinstance(obj, set):
-            return sorted(list(obj))
-        elif isinstance(obj, dict):
-            return {k: self._convert_sets_to_lists(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_sets_to_lists(item) for item in obj]
+            self._write_text_output(result, out)
+    
+    def _section_items(self, items: List[str]) -> List[str]:
+        """按 max_items 截取一个列表段落"""
+        if self.config.max_items is None:
+            return items
+        return items[:max(0, self.config.max_items)]
+    
+    def _limit_sections(self, result: Dict) -> Dict:
+        """按输出选项裁剪 JSON 结果中的文件列表，被截断的段落记录在 truncated 中"""
+        if "error" in result:
+            return result
+        
+        limited = dict(result)
+        truncated = {}
+        
+        def limit(name, items):
+            shown = self._section_items(items)
+            if len(shown) < len(items):
+                truncated[name] = len(items)
+            return shown
+        
+        limited["directories"] = {}
+        for path, info in result["directories"].items():
+            info = dict(info)
+            if self.config.omit_listing:
+                info.pop("files", None)
+            elif "files" in info:
+                info["files"] = limit(f"directories/{path}", info["files"])
+            limited["directories"][path] = info
+        if self.config.omit_common:
+            limited.pop("common_files")
+        else:
+            limited["common_files"] = limit("common_files", result["common_files"])
+        for section in ("unique_files", "missing_files"):
+            limited[section] = {path: limit(f"{section}/{path}", files)
+                                for path, files in result[section].items()}
+        if "content" in result:
+            content = dict(result["content"])
+            content["different_files"] = limit("content/different_files", content["different_files"])
+            limited["content"] = content
+        if "moves" in result:
+            limited["moves"] = limit("moves", result["moves"])
+        if "similar_files" in result:
+            limited["similar_files"] = limit("similar_files", result["similar_files"])
+        if self.config.omit_common:
+            limited.pop("identical_subtrees", None)
+        if truncated:
+            limited["truncated"] = truncated
+        return limited
+    
+    def _write_json_value(self, out: TextIO, value, level: int):
+        """以 indent=2 的格式流式写出 JSON，列表逐项写出"""
+        indent = "  " * (level + 1)
+        if isinstance(value, set):
+            value = sorted(value)
+        elif isinstance(value, KeyList) and not value:
+            value = []
+        if isinstance(value, dict) and value:
+            out.write("{")
+            for index, (key, item) in enumerate(value.items()):
+                out.write(("," if index else "") + "\n" + indent + json.dumps(key, ensure_ascii=False) + ": ")
+                self._write_json_value(out, item, level + 1)
+            out.write("\n" + "  " * level + "}")
+        elif isinstance(value, (list, tuple, KeyList)) and value:
+            out.write("[")
+            for index, item in enumerate(value):
+                out.write(("," if index else "") + "\n" + indent)
+                self._write_json_value(out, item, level + 1)
+            out.write("\n" + "  " * level + "]")
         else:
-            return obj
+            out.write(json.dumps(value, ensure_ascii=False))
+    
+    def _write_jsonl_output(self, result: Dict, out: TextIO):
+        """JSON Lines 输出：每行一条记录，type 字段区分记录类型"""
+        def emit(record):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        
+        def emit_section(record_type, items, **extra):
+            shown = self._section_items(items)
+            for file in shown:
+                emit({"type": record_type, **extra, "file": file})
+            if len(shown) < len(items):
+                emit({"type": "truncated", "section": record_type, **extra,
+                      "shown": len(shown), "total": len(items)})
+        
+        if "error" in result:
+            emit({"type": "error", "message": result["error"]})
+            return
+        
+        emit({"type": "config", **result["config"]})
+        emit({"type": "summary", **result["summary"]})
+        for path, info in result["directories"].items():
+            emit({"type": "directory", "path": path, "file_count": info["file_count"]})
+        if not self.config.omit_common:
+            emit_section("common", result["common_files"])
+            for item in result.get("identical_subtrees", []):
+                emit({"type": "identical_subtree", **item})
+        for path, files in result["unique_files"].items():
+            emit_section("unique", files, path=path)
+        for path, files in result["missing_files"].items():
+            emit_section("missing", files, path=path)
+        if "content" in result:
+            content = result["content"]
+            emit_section("content_differs", content["different_files"])
+            emit_section("content_unverified", content["unverified_files"])
+        if "moves" in result:
+            moves = self._section_items(result["moves"])
+            for move in moves:
+                emit({"type": "move", **move})
+            if len(moves) < len(result["moves"]):
+                emit({"type": "truncated", "section": "move",
+                      "shown": len(moves), "total": len(result["moves"])})
+        if "similar_files" in result:
+            similar = self._section_items(result["similar_files"])
+            for match in similar:
+                emit({"type": "similar", **match})
+            if len(similar) < len(result["similar_files"]):
+                emit({"type": "truncated", "section": "similar",
+                      "shown": len(similar), "total": len(result["similar_files"])})
+    
+    def _write_items(self, out: TextIO, items: List[str], prefix: str):
+        """逐行写出一个文件列表段落，超出 max_items 的部分只给出数量"""
+        shown = self._section_items(items)
+        for file in shown:
+            out.write(f"{prefix}{file}\n")
+        if len(shown) < len(items):
+            out.write(f"{prefix}... 另有 {len(items) - len(shown)} 个未列出\n")
+    
+    def _write_matrix_output(self, result: Dict, out: TextIO):
+        """
+        写出存在矩阵：每行一个文件，每列一个目录，只列出并非所有目录都有的文件
+        """
+        if "error" in result:
+            out.write(f"错误: {result['error']}\n")
+            return
+        
+        paths = list(self.file_sets.keys())
+        full_mask = (1 << len(paths)) - 1
+        width = len(str(len(paths)))
+        limit = self.config.max_items
+        
+        out.write("=" * 60 + "\n")
+        out.write("目录文件存在矩阵\n")
+        out.write("=" * 60 + "\n")
+        out.write("\n")
+        out.write("目录:\n")
+        for index, path in enumerate(paths, 1):
+            out.write(f"  [{index:>{width}}] {path} ({result['directories'][path]['file_count']} 个文件)\n")
+        out.write("\n")
+        
+        out.write(" ".join(f"{index:>{width}}" for index in range(1, len(paths) + 1)) + "\n")
+        different = 0
+        for key_id in self.sorted_keys:
+            mask = self.presence[key_id]
+            if mask == full_mask:
+                continue
+            different += 1
+            if limit is not None and different > limit:
+                continue
+            cells = " ".join(f"{'✓' if mask >> index & 1 else '·':>{width}}" for index in range(len(paths)))
+            out.write(f"{cells}  {self.key_table.key(key_id)}\n")
+        if limit is not None and different > limit:
+            out.write(f"... 另有 {different - limit} 行未列出\n")
+        out.write("\n")
+        out.write(f"共 {result['summary']['total_unique_files']} 个文件，{result['summary']['common_files_count']} 个所有目录都有（未列出），"
+                  f"{different} 个存在差异\n")
     
-    def _format_text_output(self, result: Dict) -> str:
-        """格式化文本输出"""
+    def _write_text_output(self, result: Dict, out: TextIO):
+        """逐段写出文本报告"""
+        def emit(line=""):
+            out.write(line + "\n")
+        
         if "error" in result:
-            return f"错误: {result['error']}"
+            emit(f"错误: {result['error']}")
+            return
         
-        output = []
-        output.append("=" * 60)
-        output.append("目录文件名对比报告")
-        output.append("=" * 60)
-        output.append("")
+        emit("=" * 60)
+        emit("目录文件名对比报告")
+        emit("=" * 60)
+        emit()
         
         # 配置信息
         config = result["config"]
-        output.append("对比配置:")
-        output.append(f"  递归扫描: {'是' if config['recursive'] else '否'}")
-        output.append(f"  忽略扩展名: {'是' if config['ignore_extension'] else '否'}")
+        emit("对比配置:")
+        emit(f"  递归扫描: {'是' if config['recursive'] else '否'}")
+        emit(f"  忽略扩展名: {'是' if config['ignore_extension'] else '否'}")
+        emit(f"  对比内容: {'是' if config.get('compare_content') else '否'}")
         
         # 显示分割配置
         if config.get('split_char') and config.get('split_index') is not None:
-            output.append(f"  分割字符: '{config['split_char']}'")
-            output.append(f"  对比下标: {config['split_index']}")
+            emit(f"  分割字符: '{config['split_char']}'")
+            emit(f"  对比下标: {config['split_index']}")
         else:
-            output.append("  分割模式: 未启用")
+            emit("  分割模式: 未启用")
+        if config.get('exclude'):
+            emit(f"  排除模式: {' '.join(config['exclude'])}")
+        if config.get('include'):
+            emit(f"  包含模式: {' '.join(config['include'])}")
+        if config.get('key_pattern'):
+            emit(f"  键正则: {config['key_pattern']}")
+        if config.get('key_template'):
+            emit(f"  键模板: {config['key_template']}")
+        if config.get('case_fold'):
+            emit("  忽略大小写: 是")
+        if config.get('unicode_normalize'):
+            emit(f"  Unicode 规范化: {config['unicode_normalize']}")
         
-        output.append("")
+        emit()
         
         # 摘要信息
         summary = result["summary"]
-        output.append("摘要信息:")
-        output.append(f"  对比目录数: {summary['total_directories']}")
-        output.append(f"  总文件数: {summary['total_unique_files']}")
-        output.append(f"  共同文件数: {summary['common_files_count']}")
-        output.append("")
+        emit("摘要信息:")
+        emit(f"  对比目录数: {summary['total_directories']}")
+        emit(f"  总文件数: {summary['total_unique_files']}")
+        emit(f"  共同文件数: {summary['common_files_count']}")
+        if "different_content_count" in summary:
+            emit(f"  同名但内容不同的文件数: {summary['different_content_count']}")
+        if "moved_files_count" in summary:
+            emit(f"  移动或重命名的文件数: {summary['moved_files_count']}")
+        if "similar_files_count" in summary:
+            emit(f"  名称相近的文件对数: {summary['similar_files_count']}")
+        if "identical_subtrees" in summary:
+            emit(f"  相同子树: {summary['identical_subtrees']} 个（跳过 {summary['skipped_files']} 个文件，已计入共同文件）")
+        if "pruned_files" in summary:
+            emit(f"  按模式排除: {summary['pruned_directories']} 个目录（未进入），{summary['pruned_files']} 个文件")
+        if "key_fallbacks" in summary:
+            emit(f"  未能提取键、按原名对比: {sum(summary['key_fallbacks'].values())} 个文件")
+        emit()
         
         # 各目录文件统计
-        output.append("目录文件统计:")
+        emit("目录文件统计:")
         for path, info in result["directories"].items():
-            output.append(f"  {path}: {info['file_count']} 个文件")
-        output.append("")
+            emit(f"  {path}: {info['file_count']} 个文件")
+        emit()
         
         # 共同文件
-        if result["common_files"]:
-            output.append(f"所有目录都包含的文件 ({len(result['common_files'])} 个):")
-            for file in result["common_files"]:
-                output.append(f"  ✓ {file}")
-            output.append("")
+        if result["common_files"] and not self.config.omit_common:
+            emit(f"所有目录都包含的文件 ({len(result['common_files'])} 个):")
+            self._write_items(out, result["common_files"], "  ✓ ")
+            emit()
+        
+        # Merkle 模式下跳过的相同子树
+        if result.get("identical_subtrees") and not self.config.omit_common:
+            emit(f"目录树相同、已跳过的子目录 ({len(result['identical_subtrees'])} 个):")
+            self._write_items(out, [f"{item['directory']} ({item['files']} 个文件)"
+                                    for item in result["identical_subtrees"]], "  = ")
+            emit()
         
         # 各目录独有文件
-        output.append("各目录独有文件:")
+        emit("各目录独有文件:")
         for path, unique_files in result["unique_files"].items():
             if unique_files:
-                output.append(f"  {path} 独有 ({len(unique_files)} 个):")
-                for file in unique_files:
-                    output.append(f"    + {file}")
+                emit(f"  {path} 独有 ({len(unique_files)} 个):")
+                self._write_items(out, unique_files, "    + ")
             else:
-                output.append(f"  {path}: 无独有文件")
-        output.append("")
+                emit(f"  {path}: 无独有文件")
+        emit()
         
         # 各目录缺失文件
-        output.append("各目录缺失文件:")
+        emit("各目录缺失文件:")
         for path, missing_files in result["missing_files"].items():
             if missing_files:
-                output.append(f"  {path} 缺失 ({len(missing_files)} 个):")
-                for file in missing_files:
-                    output.append(f"    - {file}")
+                emit(f"  {path} 缺失 ({len(missing_files)} 个):")
+                self._write_items(out, missing_files, "    - ")
             else:
-                output.append(f"  {path}: 无缺失文件")
+                emit(f"  {path}: 无缺失文件")
+        
+        # 同名但内容不同的文件
+        if "content" in result:
+            content = result["content"]
+            emit()
+            emit(f"同名但内容不同的文件 ({len(content['different_files'])} 个，"
+                 f"共对比 {content['compared_files']} 个同名文件):")
+            self._write_items(out, content["different_files"], "  ≠ ")
+            if content["unverified_files"]:
+                emit(f"  另有 {len(content['unverified_files'])} 个文件清单中没有哈希或 CRC，只确认了大小相同")
+            emit(f"  (头尾哈希 {content['partial_hashed']} 个文件，完整哈希 {content['full_hashed']} 个文件，"
+                 f"CRC32 {content['crc_checked']} 个文件)")
+        
+        # 移动和重命名的文件
+        if "moves" in result:
+            labels = {"move": "移动", "rename": "重命名", "move_rename": "移动并重命名"}
+            emit()
+            emit(f"内容相同的移动或重命名文件 ({len(result['moves'])} 个):")
+            self._write_items(out, [f"{move['from_dir']}: {move['from']} → {move['to_dir']}: {move['to']} "
+                                    f"({labels[move['kind']]})" for move in result["moves"]], "  ↪ ")
+        
+        # 名称相近的文件
+        if "similar_files" in result:
+            emit()
+            emit(f"名称相近的文件 ({len(result['similar_files'])} 对，相似度阈值 {self.config.fuzzy_threshold}):")
+            self._write_items(out, [f"{match['from_dir']}: {match['from']} ↔ {match['to_dir']}: {match['to']} "
+                                    f"({match['similarity']:.2f})" for match in result["similar_files"]], "  ≈ ")
+
+
+class Inotify:
+    """通过 ctypes 调用 Linux inotify 接口的最小封装"""
+    
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    
+    def add_watch(self, path: str) -> int:
+        """监视一个目录，返回 watch 描述符"""
+        wd = self._add_watch(self.fd, os.fsencode(path), INOTIFY_WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+    
+    def rm_watch(self, wd: int):
+        """取消监视，目录已删除时内核会自动取消，忽略返回值"""
+        self._rm_watch(self.fd, wd)
+    
+    def read_events(self, timeout: float = None) -> List[Tuple[int, int, str]]:
+        """
+        等待并读取事件
+        
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+        
+        Returns:
+            [(watch 描述符, 事件标志, 文件名)]，超时返回空列表
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
         
-        return "\n".join(output)
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, name))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class DirWatcher:
+    """
+    监视模式
+    
+    完整扫描一次后，根据 inotify 事件只更新发生变化的文件，增量维护各目录的键集合和位掩码，
+    每批事件处理完只输出存在情况发生变化的键。不支持 inotify 的平台改为定时重新扫描。
+    压缩包和清单文件视为不会变化。
+    """
+    
+    def __init__(self, comparer: DirCompare, out: TextIO, interval: float = 2.0):
+        self.comparer = comparer
+        self.config = comparer.config
+        self.out = out
+        self.interval = interval
+        self.paths = list(self.config.paths)
+        self.full_mask = (1 << len(self.paths)) - 1
+        # 需要监视的实时目录
+        self.live_paths = [path for path in self.paths if os.path.isdir(path)]
+        # 每个目录: 相对目录 -> 文件名集合
+        self.trees: Dict[str, Dict[str, Set[str]]] = {path: {} for path in self.live_paths}
+        # 每个目录: 键 ID -> 对应的文件数（忽略扩展名或分割对比时多个文件可能对应同一个键）
+        self.key_counts: Dict[str, Dict[int, int]] = {path: {} for path in self.live_paths}
+        self.inotify = None
+        # watch 描述符 -> (目录, 相对目录)，以及反向映射
+        self.watches: Dict[int, Tuple[str, str]] = {}
+        self.watch_ids: Dict[Tuple[str, str], int] = {}
+        self.watch_error_reported = False
+        # 本批变化涉及的键 ID -> 变化前的位掩码
+        self.touched: Dict[int, int] = {}
+        self.common_count = 0
+        self.key_count = 0
+        # 初始扫描完成前只统计键，位掩码由 _analyze_differences 一次算出
+        self.ready = False
+    
+    def run(self):
+        """执行初始扫描并持续监视，Ctrl+C 结束"""
+        if sys.platform.startswith('linux'):
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                print(f"警告: 无法使用 inotify ({e})，改为每 {self.interval} 秒重新扫描")
+        else:
+            print(f"提示: 当前平台不支持 inotify，改为每 {self.interval} 秒重新扫描")
+        
+        try:
+            self.comparer.write_output(self._initial_scan(), self.out)
+            self._write_legend()
+            while True:
+                if self.inotify:
+                    events = self.inotify.read_events()
+                    # 稍等片刻，把同一批文件操作产生的事件合并处理
+                    time.sleep(WATCH_BATCH_DELAY)
+                    events.extend(self.inotify.read_events(0))
+                    for wd, mask, name in events:
+                        self._handle_event(wd, mask, name)
+                else:
+                    time.sleep(self.interval)
+                    self._rescan()
+                self._emit_changes()
+        except KeyboardInterrupt:
+            print("监视已停止")
+        finally:
+            if self.inotify:
+                self.inotify.close()
+    
+    def _initial_scan(self) -> Dict:
+        """完整扫描所有目录，同时为每个子目录建立监视，返回完整的对比结果"""
+        print("开始扫描目录...")
+        for path in self.paths:
+            if path in self.trees:
+                self._apply_listing(path, self._list_subtree(path, ''))
+                self.comparer.file_sets[path] = array('I', sorted(self.key_counts[path]))
+            else:
+                self.comparer.file_sets[path] = self.comparer.get_files_in_dir(path)
+            print(f"扫描目录: {path}")
+            print(f"  找到 {len(self.comparer.file_sets[path])} 个文件")
+        
+        result = self.comparer._analyze_differences()
+        self.common_count = result.get("summary", {}).get("common_files_count", 0)
+        self.key_count = len(self.comparer.sorted_keys)
+        self.ready = True
+        return result
+    
+    def _write_legend(self):
+        if self.config.output_format == 'jsonl':
+            return
+        self.out.write("\n")
+        self.out.write(f"正在监视 {len(self.live_paths)} 个目录的变化 (Ctrl+C 结束)，列顺序:\n")
+        for index, path in enumerate(self.paths, 1):
+            self.out.write(f"  [{index}] {path}\n")
+        self.out.flush()
+    
+    def _list_subtree(self, path: str, rel_dir: str) -> List[Tuple[str, List[str]]]:
+        """并行列出一个子树，返回 [(相对目录, 文件名列表)]，同时为每个目录建立监视"""
+        root = os.path.join(path, rel_dir) if rel_dir else path
+        
+        def scan(abs_dir, relative_dir):
+            # 遍历器以 '' 作为根目录的相对路径，这里换成子树在整个目录中的相对路径
+            relative_dir = relative_dir or rel_dir
+            # 先建立监视再列目录，避免漏掉两者之间新建的文件
+            self._add_watch(path, abs_dir, relative_dir)
+            files, subdirs = self.comparer._scan_one_directory(abs_dir, relative_dir, need_stat=False)
+            return [(relative_dir, [name for _, name, _, _ in files])], subdirs
+        
+        try:
+            return self.comparer._walk_directory(root, scan)
+        except OSError as e:
+            # 子树在列出前已被删除或移走
+            print(f"警告: 读取目录 '{root}' 失败: {e}")
+            return []
+    
+    def _apply_listing(self, path: str, listing: List[Tuple[str, List[str]]]):
+        tree = self.trees[path]
+        for relative_dir, names in listing:
+            tree.setdefault(relative_dir, set())
+            for name in names:
+                self._add_file(path, relative_dir, name)
+    
+    def _add_watch(self, path: str, abs_dir: str, relative_dir: str):
+        if not self.inotify:
+            return
+        try:
+            wd = self.inotify.add_watch(abs_dir)
+        except OSError as e:
+            if not self.watch_error_reported:
+                self.watch_error_reported = True
+                hint = "，可调大 /proc/sys/fs/inotify/max_user_watches" if e.errno == errno.ENOSPC else ""
+                print(f"警告: 无法监视目录 '{abs_dir}': {e}{hint}")
+            return
+        self.watches[wd] = (path, relative_dir)
+        self.watch_ids[(path, relative_dir)] = wd
+    
+    def _add_file(self, path: str, relative_dir: str, name: str):
+        names = self.trees[path].setdefault(relative_dir, set())
+        if name in names:
+            return
+        names.add(name)
+        key_id = self.comparer.key_table.intern(self.comparer._make_key(relative_dir, name))
+        counts = self.key_counts[path]
+        counts[key_id] = counts.get(key_id, 0) + 1
+        if counts[key_id] == 1:
+            self._set_presence(path, key_id, True)
+    
+    def _remove_file(self, path: str, relative_dir: str, name: str):
+        names = self.trees[path].get(relative_dir)
+        if not names or name not in names:
+            return
+        names.discard(name)
+        key_id = self.comparer.key_table.intern(self.comparer._make_key(relative_dir, name))
+        counts = self.key_counts[path]
+        counts[key_id] -= 1
+        if not counts[key_id]:
+            del counts[key_id]
+            self._set_presence(path, key_id, False)
+    
+    def _remove_subtree(self, path: str, rel_dir: str):
+        """移除一个子目录及其下所有文件，并取消对应的监视"""
+        tree = self.trees[path]
+        prefix = rel_dir + os.sep
+        for relative_dir in [rel for rel in tree if rel == rel_dir or rel.startswith(prefix)]:
+            for name in list(tree[relative_dir]):
+                self._remove_file(path, relative_dir, name)
+            del tree[relative_dir]
+            wd = self.watch_ids.pop((path, relative_dir), None)
+            if wd is not None:
+                self.watches.pop(wd, None)
+                # 目录被移走时内核不会自动取消监视
+                self.inotify.rm_watch(wd)
+    
+    def _set_presence(self, path: str, key_id: int, present: bool):
+        """更新键的位掩码，并记录本批变化前的值"""
+        if not self.ready:
+            return
+        presence = self.comparer.presence
+        if key_id >= len(presence):
+            # 新登记的键
+            presence.extend([0] * (key_id + 1 - len(presence)))
+        old = presence[key_id]
+        self.touched.setdefault(key_id, old)
+        bit = 1 << self.paths.index(path)
+        new = old | bit if present else old & ~bit
+        presence[key_id] = new
+        if old == self.full_mask:
+            self.common_count -= 1
+        if new == self.full_mask:
+            self.common_count += 1
+        if not old:
+            self.key_count += 1
+        if not new:
+            self.key_count -= 1
+    
+    def _handle_event(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出，已无法得知具体变化，重新扫描一遍
+            print("警告: inotify 事件队列溢出，重新扫描")
+            self._rescan()
+            return
+        
+        target = self.watches.get(wd)
+        if target is None:
+            return
+        if mask & IN_IGNORED:
+            # 目录已删除，内核自动取消了监视
+            del self.watches[wd]
+            if self.watch_ids.get(target) == wd:
+                del self.watch_ids[target]
+            return
+        if not name:
+            return
+        
+        path, relative_dir = target
+        child = relative_dir + os.sep + name if relative_dir else name
+        path_filter = self.comparer.path_filter
+        if path_filter and path_filter.excluded(child.replace(os.sep, '/'), bool(mask & IN_ISDIR)):
+            return
+        if mask & IN_ISDIR:
+            if not self.config.recursive:
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._apply_listing(path, self._list_subtree(path, child))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove_subtree(path, child)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            if path_filter and not path_filter.included(child.replace(os.sep, '/')):
+                return
+            if os.path.isfile(os.path.join(path, child)):
+                self._add_file(path, relative_dir, name)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self._remove_file(path, relative_dir, name)
+    
+    def _rescan(self):
+        """重新扫描所有实时目录，与当前状态比较后更新"""
+        for path in self.live_paths:
+            tree = self.trees[path]
+            listing = {relative_dir: set(names) for relative_dir, names in self._list_subtree(path, '')}
+            for relative_dir in list(tree):
+                if relative_dir not in listing:
+                    for name in list(tree[relative_dir]):
+                        self._remove_file(path, relative_dir, name)
+                    del tree[relative_dir]
+                    wd = self.watch_ids.pop((path, relative_dir), None)
+                    if wd is not None:
+                        self.watches.pop(wd, None)
+            for relative_dir, names in listing.items():
+                for name in tree.get(relative_dir, set()) - names:
+                    self._remove_file(path, relative_dir, name)
+                tree.setdefault(relative_dir, set())
+                for name in names:
+                    self._add_file(path, relative_dir, name)
+    
+    def _emit_changes(self):
+        """输出本批中存在情况发生变化的键"""
+        presence = self.comparer.presence
+        key = self.comparer.key_table.key
+        changes = sorted((key(key_id), old, presence[key_id]) for key_id, old in self.touched.items()
+                         if presence[key_id] != old)
+        self.touched = {}
+        if not changes:
+            return
+        
+        now = time.strftime('%H:%M:%S')
+        if self.config.output_format == 'jsonl':
+            for key, old, new in changes:
+                record = {
+                    "type": "change",
+                    "time": now,
+                    "file": key,
+                    "present": [path for index, path in enumerate(self.paths) if new >> index & 1],
+                    "previous": [path for index, path in enumerate(self.paths) if old >> index & 1]
+                }
+                self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            def cells(mask):
+                return " ".join('✓' if mask >> index & 1 else '·' for index in range(len(self.paths)))
+            
+            self.out.write(f"[{now}] {len(changes)} 个文件的存在情况发生变化 "
+                           f"(共同 {self.common_count} 个，存在差异 {self.key_count - self.common_count} 个):\n")
+            for key, old, new in changes:
+                self.out.write(f"  {cells(old)}  →  {cells(new)}  {key}\n")
+        self.out.flush()
 
 
 def load_config_from_file(config_file: str) -> CompareConfig:
@@ -297,6 +2108,80 @@ def load_config_from_file(config_file: str) -> CompareConfig:
         return None
 
 
+def archive_type(path: str) -> str:
+    """判断文件是否为支持的压缩包，返回 'zip'、'tar' 或 None"""
+    if zipfile.is_zipfile(path):
+        return 'zip'
+    if tarfile.is_tarfile(path):
+        return 'tar'
+    return None
+
+
+def compute_digests(directories: Dict[str, Dict], use_hashes: bool) -> bool:
+    """
+    自底向上计算清单中每个目录的 Merkle 摘要和子树文件数
+    
+    目录摘要由直接子项组成：文件只取名称（与按文件名对比一致），use_hashes 时取 名称、大小、内容哈希，
+    缺少哈希的文件以修改时间代替；子目录取 名称和子目录摘要。结果写入目录记录的 digest 或 content_digest 以及 count。
+    
+    Args:
+        directories: 清单中的目录记录，键为使用 '/' 分隔的相对目录
+        use_hashes: 是否使用文件内容哈希
+    
+    Returns:
+        use_hashes 时所有文件都有哈希返回 True
+    """
+    digest_key = 'content_digest' if use_hashes else 'digest'
+    complete = True
+    # 深的目录先算
+    order = sorted(directories, key=lambda rel: rel.count('/') + 1 if rel else 0, reverse=True)
+    for posix_dir in order:
+        record = directories[posix_dir]
+        digest = hashlib.blake2b(digest_size=16)
+        count = 0
+        for item in sorted(record['files']):
+            name, size = item[0], item[1]
+            if use_hashes:
+                # 不超过两个块的文件，头尾哈希已覆盖全部内容
+                value = item[3] if len(item) > 3 and size <= 2 * HASH_BLOCK_SIZE else \
+                    (item[4] if len(item) > 4 else None)
+                complete = complete and bool(value)
+                line = f"f\0{name}\0{size}\0{value or int(item[2])}\n"
+            else:
+                line = f"f\0{name}\n"
+            digest.update(line.encode('utf-8', 'surrogateescape'))
+            count += 1
+        prefix = posix_dir + '/' if posix_dir else ''
+        for name in sorted(record['dirs']):
+            child = directories.get(prefix + name)
+            if child is None:
+                continue
+            digest.update(f"d\0{name}\0{child[digest_key]}\n".encode('utf-8', 'surrogateescape'))
+            count += child['count']
+        record[digest_key] = digest.hexdigest()
+        record['count'] = count
+    return complete
+
+
+def load_manifest(manifest_file: str) -> Dict:
+    """读取扫描清单，.gz 结尾的文件按 gzip 解压"""
+    opener = gzip.open if manifest_file.endswith('.gz') else open
+    with opener(manifest_file, 'rt', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError("不是有效的扫描清单文件")
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"不支持的清单版本: {manifest.get('version')}")
+    return manifest
+
+
+def save_manifest(manifest: Dict, manifest_file: str):
+    """保存扫描清单，使用紧凑格式，.gz 结尾时使用 gzip 压缩"""
+    opener = gzip.open if manifest_file.endswith('.gz') else open
+    with opener(manifest_file, 'wt', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+
+
 def create_sample_config(output_file: str = None):
     """创建示例配置文件"""
     if output_file is None:
@@ -310,7 +2195,21 @@ def create_sample_config(output_file: str = None):
         ignore_extension=False,
         output_format="text",
         split_char=None,
-        split_index=None
+        split_index=None,
+        workers=8,
+        compare_content=False,
+        max_items=None,
+        omit_common=False,
+        omit_listing=False,
+        detect_moves=False,
+        exclude=[".git/", "node_modules/", "*.tmp"],
+        include=None,
+        merkle=False,
+        key_pattern=None,
+        key_template=None,
+        case_fold=False,
+        unicode_normalize=None,
+        fuzzy_threshold=None
     )
     
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -340,6 +2239,38 @@ def main():
   # 输出为JSON格式
   python dir_compare.py -p ./dir1 ./dir2 --output json
   
+  # 同时对比同名文件的内容
+  python dir_compare.py -p ./dir1 ./dir2 --content
+  
+  # 对比发布压缩包与工作目录（支持 zip、tar、tar.gz 等，不解压）
+  python dir_compare.py -p release.zip ./build --content
+  
+  # 监视模式：持续输出对比结果的变化
+  python dir_compare.py -p ./local /mnt/sync --watch
+  
+  # 跳过版本库、依赖和构建目录（被排除的目录不会被打开）
+  python dir_compare.py -p ./dir1 ./dir2 --exclude .git/ node_modules/ "Library/" "*.tmp"
+  python dir_compare.py -p ./dir1 ./dir2 --exclude-from .gitignore --include "Assets/**"
+  
+  # Merkle 模式：只深入摘要不同的子目录（对比两份清单时最快）
+  python dir_compare.py -p backup_0101.json.gz backup_0201.json.gz --merkle
+  
+  # 按正则提取对比键：只对比 "IMG_20240101_xxx.jpg" 中的日期部分，忽略大小写
+  python dir_compare.py -p ./dir1 ./dir2 --key-pattern "(\\d{8})" --casefold
+  
+  # 配对只差版本号、大小写或个别字符的独有文件
+  python dir_compare.py -p ./old ./new --fuzzy 0.75
+  
+  # 识别在目录间移动或重命名的文件
+  python dir_compare.py -p ./old ./new --detect-moves
+  
+  # 保存目录扫描清单（含哈希），之后与实时目录对比
+  python dir_compare.py -p /mnt/backup --save-manifest backup.json.gz --hash
+  python dir_compare.py -p backup.json.gz ./dir1 --content
+  
+  # 增量刷新已有清单，只重新扫描修改时间变化的目录
+  python dir_compare.py -p /mnt/backup --save-manifest backup.json.gz --refresh
+  
   # 创建示例配置文件（默认在脚本目录）
   python dir_compare.py --create-config
   
@@ -349,7 +2280,7 @@ def main():
     )
     
     parser.add_argument('-p', '--paths', nargs='+', 
-                       help='要对比的目录路径列表')
+                       help='要对比的目录路径列表，也可以是压缩包或扫描清单文件')
     parser.add_argument('-c', '--config', 
                        help='配置文件路径')
     parser.add_argument('--no-recursive', action='store_true',
@@ -360,8 +2291,48 @@ def main():
                        help='分割字符，如 "_", "-", "."')
     parser.add_argument('--split-index', type=int,
                        help='分割后要对比的下标位置（支持负数）')
-    parser.add_argument('--output', choices=['text', 'json'], default='text',
-                       help='输出格式 (默认: text)')
+    parser.add_argument('--key-pattern', metavar='REGEX',
+                       help='从文件名中提取对比键的正则表达式，默认取第一个分组')
+    parser.add_argument('--key-template', metavar='TEMPLATE',
+                       help='由正则分组组成对比键的模板，如 "{1}_{2}"、"{name}"，{0} 为整个匹配')
+    parser.add_argument('--casefold', action='store_true',
+                       help='对比文件名时忽略大小写')
+    parser.add_argument('--normalize', choices=KeyExtractor.NORMAL_FORMS,
+                       help='对比前对文件名做 Unicode 规范化（如 macOS 与 Linux 之间用 NFC）')
+    parser.add_argument('--exclude', nargs='+', metavar='PATTERN',
+                       help='gitignore 风格的排除模式，如 .git/ node_modules/ "*.tmp"')
+    parser.add_argument('--exclude-from', metavar='FILE',
+                       help='从文件（如 .gitignore）读取排除模式')
+    parser.add_argument('--include', nargs='+', metavar='PATTERN',
+                       help='包含模式，设置后只对比匹配的文件')
+    parser.add_argument('--workers', type=int, default=8,
+                       help='扫描目录和计算哈希时的并行线程数 (默认: 8)')
+    parser.add_argument('--content', action='store_true',
+                       help='对比同名文件的内容（依次对比大小、头尾块哈希、完整哈希）')
+    parser.add_argument('--merkle', action='store_true',
+                       help='按目录摘要跳过完全相同的子树，适合对比大部分相同的清单（实时目录仍需完整扫描）')
+    parser.add_argument('--detect-moves', action='store_true',
+                       help='按内容识别在目录间移动或重命名的文件')
+    parser.add_argument('--fuzzy', nargs='?', type=float, const=0.8, metavar='THRESHOLD',
+                       help='按名称相似度配对各目录的独有文件，可指定阈值 (默认: 0.8)')
+    parser.add_argument('--watch', action='store_true',
+                       help='监视模式：完整扫描一次后持续输出对比结果的变化')
+    parser.add_argument('--interval', type=float, default=2.0,
+                       help='不支持 inotify 时重新扫描的间隔秒数 (默认: 2)')
+    parser.add_argument('--save-manifest', metavar='FILE',
+                       help='扫描单个目录并保存为清单文件（.gz 结尾时压缩）')
+    parser.add_argument('--hash', action='store_true',
+                       help='保存清单时同时保存文件哈希')
+    parser.add_argument('--refresh', action='store_true',
+                       help='保存清单时基于已有清单增量刷新')
+    parser.add_argument('--output', choices=['text', 'json', 'jsonl', 'matrix'], default='text',
+                       help='输出格式，jsonl 为每行一条记录，matrix 为目录文件存在矩阵 (默认: text)')
+    parser.add_argument('--max-items', type=int,
+                       help='每个文件列表段落最多输出的条数，0 表示只输出数量')
+    parser.add_argument('--omit-common', action='store_true',
+                       help='不列出所有目录都包含的文件')
+    parser.add_argument('--omit-listing', action='store_true',
+                       help='JSON 输出中不列出每个目录的完整文件列表，只保留文件数')
     parser.add_argument('--save-to', 
                        help='保存结果到文件')
     parser.add_argument('--create-config', nargs='?', const=True, metavar='FILE',
@@ -379,6 +2350,37 @@ def main():
             create_sample_config(args.create_config)
         return
     
+    # 排除模式
+    exclude = list(args.exclude or [])
+    if args.exclude_from:
+        try:
+            with open(args.exclude_from, 'r', encoding='utf-8') as f:
+                exclude = f.read().splitlines() + exclude
+        except OSError as e:
+            print(f"错误: 读取排除模式文件失败: {e}")
+            return
+    
+    # 保存扫描清单
+    if args.save_manifest:
+        if not args.paths or len(args.paths) != 1 or not os.path.isdir(args.paths[0]):
+            print("错误: 保存清单时需要通过 -p 指定一个目录")
+            return
+        
+        previous = None
+        if args.refresh and os.path.exists(args.save_manifest):
+            try:
+                previous = load_manifest(args.save_manifest)
+            except (OSError, ValueError) as e:
+                print(f"警告: 读取已有清单失败，将完整扫描: {e}")
+        
+        config = CompareConfig(paths=args.paths, recursive=not args.no_recursive, workers=args.workers,
+                               exclude=exclude or None, include=args.include)
+        manifest = DirCompare(config).build_manifest(args.paths[0], previous, with_hashes=args.hash)
+        save_manifest(manifest, args.save_manifest)
+        file_count = sum(len(record['files']) for record in manifest['directories'].values())
+        print(f"清单已保存到: {args.save_manifest} ({len(manifest['directories'])} 个目录，{file_count} 个文件)")
+        return
+    
     # 确定配置
     config = None
     if args.config:
@@ -401,27 +2403,52 @@ def main():
             ignore_extension=args.ignore_ext,
             output_format=args.output,
             split_char=args.split_char,
-            split_index=args.split_index
+            split_index=args.split_index,
+            workers=args.workers,
+            compare_content=args.content,
+            max_items=args.max_items,
+            omit_common=args.omit_common,
+            omit_listing=args.omit_listing,
+            detect_moves=args.detect_moves,
+            exclude=exclude or None,
+            include=args.include,
+            merkle=args.merkle,
+            key_pattern=args.key_pattern,
+            key_template=args.key_template,
+            case_fold=args.casefold,
+            unicode_normalize=args.normalize,
+            fuzzy_threshold=args.fuzzy
         )
     else:
         print("错误: 请指定要对比的目录路径或配置文件")
         parser.print_help()
         return
     
+    try:
+        comparer = DirCompare(config)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return
+    
+    # 监视模式
+    if args.watch:
+        if args.save_to:
+            with open(args.save_to, 'w', encoding='utf-8') as f:
+                DirWatcher(comparer, f, args.interval).run()
+        else:
+            DirWatcher(comparer, sys.stdout, args.interval).run()
+        return
+    
     # 执行对比
-    comparer = DirCompare(config)
     result = comparer.compare_directories()
     
-    # 格式化输出
-    output = comparer.format_output(result)
-    
-    # 输出结果
+    # 逐段输出结果，不在内存中拼接完整报告
     if args.save_to:
         with open(args.save_to, 'w', encoding='utf-8') as f:
-            f.write(output)
+            comparer.write_output(result, f)
         print(f"结果已保存到: {args.save_to}")
     else:
-        print(output)
+        comparer.write_output(result, sys.stdout)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录文件对比工具的回归测试
+"""
+
+from dir_compare import PathFilter
+
+
+def test_path_filter_escaped_hash_and_bang():
+    """'\\#' 和 '\\!' 去掉反斜杠后按字面匹配，不会被当作注释或取反"""
+    path_filter = PathFilter(exclude=['*.tmp', '\\#notes.txt', '\\!important.log', '# 注释'])
+    assert path_filter.skip_file('#notes.txt')
+    assert path_filter.skip_file('sub/!important.log')
+    assert not path_filter.skip_file('notes.txt')
+    assert not path_filter.skip_file('important.log')
+    assert not path_filter.skip_file('# 注释')
+
+    path_filter = PathFilter(exclude=['*.log', '!keep.log', '\\!keep.log'])
+    assert path_filter.skip_file('!keep.log')
+    assert not path_filter.skip_file('keep.log')
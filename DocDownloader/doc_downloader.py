@@ -16,6 +16,10 @@ from pathlib import Path
 from bs4 import BeautifulSoup
 from collections import deque
 import json
+import html
+
+# 爬取清单文件名（记录页面的BFS顺序、父页面和标题，供HtmlToEpub使用）
+MANIFEST_FILE = 'crawl_manifest.json'
 
 class DocDownloader:
     def __init__(self, base_url, output_dir, max_depth=10, delay=0.5):
@@ -43,6 +47,10 @@ class DocDownloader:
         self.visited_urls = set()
         # 待下载的URL队列 (url, depth, parent_url)
         self.url_queue = deque([(base_url, 0, None)])
+        # 按BFS顺序记录的页面清单
+        self.pages = []
+        # 已记录到清单中的本地路径
+        self.recorded_paths = set()
         # 下载统计
         self.stats = {
             'pages': 0,
@@ -174,6 +182,50 @@ class DocDownloader:
                     print(f"将继续下载未完成的页面...")
             except Exception as e:
                 print(f"无法加载下载记录: {str(e)}")
+        
+        # 恢复之前的爬取清单
+        manifest_file = self.output_dir / MANIFEST_FILE
+        if manifest_file.exists():
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get('base_url') == self.base_url:
+                    self.pages = manifest.get('pages', [])
+                    self.recorded_paths = {page['path'] for page in self.pages}
+            except Exception as e:
+                print(f"无法加载爬取清单: {str(e)}")
+    
+    def record_page(self, url, depth, parent_url, html_content):
+        """将页面记录到爬取清单中（同一本地文件只记录第一次访问）"""
+        local_path = self.get_local_path(url)
+        relative_path = local_path.relative_to(self.output_dir).as_posix()
+        if relative_path in self.recorded_paths:
+            return
+        self.recorded_paths.add(relative_path)
+        
+        # 只需要标题，用正则提取，避免再解析一次整个页面
+        title = None
+        match = re.search(r'<title[^>]*>(.*?)</title>', html_content, re.IGNORECASE | re.DOTALL)
+        if match:
+            title = html.unescape(match.group(1)).strip() or None
+        
+        self.pages.append({
+            'url': url,
+            'path': relative_path,
+            'parent': parent_url,
+            'title': title,
+            'depth': depth
+        })
+    
+    def save_manifest(self):
+        """保存爬取清单"""
+        manifest_file = self.output_dir / MANIFEST_FILE
+        manifest = {
+            'base_url': self.base_url,
+            'pages': self.pages
+        }
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
     
     def download_file(self, url, local_path):
         """下载文件（支持断点续传）"""
@@ -308,6 +360,7 @@ class DocDownloader:
             try:
                 with open(local_path, 'r', encoding='utf-8') as f:
                     html_content = f.read()
+                self.record_page(url, depth, parent_url, html_content)
                 # 提取链接并添加到队列
                 if depth < self.max_depth:
                     links = self.extract_links(html_content, url)
@@ -354,6 +407,7 @@ class DocDownloader:
                     f.write(processed_html)
                 
                 self.stats['pages'] += 1
+                self.record_page(url, depth, parent_url, html_content)
                 
                 # 提取链接并添加到队列
                 if depth < self.max_depth:
@@ -454,6 +508,9 @@ class DocDownloader:
         }
         with open(record_file, 'w', encoding='utf-8') as f:
             json.dump(record, f, indent=2, ensure_ascii=False)
+        
+        # 保存爬取清单
+        self.save_manifest()
 
 
 def main():
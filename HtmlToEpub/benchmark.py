@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML转EPUB性能测试工具
+
+生成可重复的合成HTML文档集，使用不同的转换选项运行转换，
+统计吞吐量（文件/秒）、各阶段耗时、输出文件大小和内存峰值
+"""
+
+import os
+import io
+import sys
+import json
+import random
+import argparse
+import tempfile
+import shutil
+import multiprocessing
+from contextlib import redirect_stdout
+from queue import Empty
+from pathlib import Path
+from PIL import Image
+
+from html_to_epub import HtmlToEpub, ConversionProfiler, DEFAULT_MAX_CHAPTER_SIZE, DEFAULT_COMPRESS_LEVEL
+
+try:
+    import resource
+except ImportError:
+    # Windows 下没有 resource 模块，无法统计RSS峰值
+    resource = None
+
+# 预设的转换选项组合
+BENCHMARK_CONFIGS = {
+    'default': {},
+    'no-split': {'max_chapter_size': 0},
+    'small-chapters': {'max_chapter_size': 64 * 1024},
+    'store': {'compress_level': 0},
+    'max-compress': {'compress_level': 9},
+    'single-thread': {'workers': 1},
+}
+
+LOREM_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+               'incididunt ut labore et dolore magna aliqua ut enim ad minim veniam quis nostrud '
+               'exercitation ullamco laboris nisi aliquip ex ea commodo consequat').split()
+
+
+def _random_bytes(rng, count):
+    """生成指定长度的随机字节（兼容 Python 3.9 以下没有 randbytes 的版本）"""
+    return rng.getrandbits(count * 8).to_bytes(count, 'little')
+
+
+def generate_corpus(output_dir, files=100, page_kb=20, images=2, image_size=256,
+                    toc='nested', depth=2, seed=0):
+    """
+    生成合成HTML文档集
+    
+    Args:
+        output_dir: 输出目录
+        files: HTML文件数量（不含目录页）
+        page_kb: 每个页面的大约大小（KB）
+        images: 每个页面引用的图片数量
+        image_size: 图片边长（像素）
+        toc: 目录形式 nested（按子目录嵌套）、flat（所有文件在根目录）或 none（不生成目录页）
+        depth: nested 模式下的子目录嵌套层数
+        seed: 随机种子，相同参数和种子生成的文档集完全相同
+    
+    Returns:
+        生成的HTML文件数量（含目录页）
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    images_dir = output_dir / 'images'
+    images_dir.mkdir(exist_ok=True)
+    
+    # 图片池：噪点图片难以压缩，更接近真实截图的大小；PNG和JPEG各占一半
+    image_pool = []
+    pool_size = min(files * images, max(images, files // 2 + 1)) if images else 0
+    for idx in range(pool_size):
+        ext = '.png' if idx % 2 == 0 else '.jpg'
+        img = Image.frombytes('RGB', (image_size, image_size), _random_bytes(rng, image_size * image_size * 3))
+        img_name = f'img_{idx}{ext}'
+        img.save(images_dir / img_name, format='PNG' if ext == '.png' else 'JPEG')
+        image_pool.append(img_name)
+    
+    # 确定每个页面的相对路径
+    pages = []
+    for idx in range(files):
+        if toc == 'nested' and depth > 0:
+            # 每层目录放 fan_out 个子目录，使页面大致均匀分布
+            fan_out = max(2, round(files ** (1 / (depth + 1))))
+            parts = []
+            rest = idx
+            for _ in range(depth):
+                parts.append(f'section_{rest % fan_out}')
+                rest //= fan_out
+            pages.append('/'.join(parts + [f'page_{idx}.html']))
+        else:
+            pages.append(f'page_{idx}.html')
+    
+    target_size = page_kb * 1024
+    for idx, page in enumerate(pages):
+        page_path = output_dir / page
+        page_path.parent.mkdir(parents=True, exist_ok=True)
+        to_root = '../' * page.count('/')
+        
+        body = [f'<h1 id="top">Page {idx}</h1>']
+        size = 0
+        section = 0
+        while size < target_size:
+            section += 1
+            words = ' '.join(rng.choice(LOREM_WORDS) for _ in range(120))
+            block = f'<h2 id="s{section}">Section {section}</h2><p>{words}</p>'
+            if section % 3 == 0:
+                block += f'<pre><code>def func_{section}():\n    return {section}\n</code></pre>'
+            body.append(block)
+            size += len(block)
+        for img_idx in range(images):
+            img_name = image_pool[(idx * images + img_idx) % len(image_pool)]
+            body.insert(1 + img_idx, f'<img src="{to_root}images/{img_name}" alt="{img_name}"/>')
+        if idx + 1 < len(pages):
+            next_href = os.path.relpath(pages[idx + 1], os.path.dirname(page) or '.').replace('\\', '/')
+            body.append(f'<p><a href="{next_href}#top">Next</a></p>')
+        
+        html = (f'<!DOCTYPE html><html><head><title>Page {idx}</title>'
+                f'<style>body {{ color: #333; }}</style><script>var page = {idx};</script></head>'
+                f'<body>{"".join(body)}</body></html>')
+        with open(page_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+    
+    if toc != 'none':
+        links = ''.join(f'<li><a href="{page}">Page {idx}</a></li>' for idx, page in enumerate(pages))
+        with open(output_dir / 'index.html', 'w', encoding='utf-8') as f:
+            f.write(f'<!DOCTYPE html><html><head><title>Index</title></head>'
+                    f'<body><nav class="toc"><ul>{links}</ul></nav></body></html>')
+        return files + 1
+    return files
+
+
+def _run_conversion(corpus_dir, output_file, options, queue):
+    """在子进程中执行一次转换，保证每次测量的内存峰值互不影响"""
+    profiler = ConversionProfiler(trace_memory=False)
+    converter = HtmlToEpub(
+        input_dir=corpus_dir,
+        output_file=output_file,
+        title='Benchmark',
+        max_chapter_size=options.get('max_chapter_size', DEFAULT_MAX_CHAPTER_SIZE),
+        compress_level=options.get('compress_level', DEFAULT_COMPRESS_LEVEL),
+        workers=options.get('workers'),
+        profiler=profiler
+    )
+    with redirect_stdout(io.StringIO()):
+        success = converter.convert()
+    
+    peak_rss = None
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位是KB，macOS 单位是字节
+        if sys.platform != 'darwin':
+            peak_rss *= 1024
+    
+    queue.put({
+        'success': bool(success),
+        'total': profiler.total_wall,
+        'cpu': profiler.total_cpu,
+        'stages': {name: stat['wall'] for name, stat in profiler.stages.items()},
+        'chapters': len(converter.chapters),
+        'images': len(converter.images),
+        'output_size': os.path.getsize(output_file) if success else 0,
+        'peak_rss': peak_rss,
+    })
+
+
+def run_benchmark(corpus_dir, config_names, repeat=1):
+    """
+    使用每组选项转换文档集，每组重复 repeat 次取耗时最短的一次
+    
+    Returns:
+        {选项名称: 结果}
+    """
+    corpus_dir = Path(corpus_dir)
+    html_count = sum(1 for p in corpus_dir.rglob('*') if p.suffix.lower() in ('.html', '.htm'))
+    ctx = multiprocessing.get_context('spawn')
+    output_dir = Path(tempfile.mkdtemp(prefix='html_to_epub_bench_'))
+    results = {}
+    try:
+        for name in config_names:
+            best = None
+            for run in range(repeat):
+                output_file = output_dir / f'{name}_{run}.epub'
+                queue = ctx.Queue()
+                process = ctx.Process(target=_run_conversion,
+                                      args=(str(corpus_dir), str(output_file), BENCHMARK_CONFIGS[name], queue))
+                process.start()
+                result = None
+                while result is None:
+                    try:
+                        result = queue.get(timeout=1)
+                    except Empty:
+                        if not process.is_alive():
+                            break
+                process.join()
+                if result is None:
+                    # 子进程异常退出
+                    result = {'success': False, 'total': 0, 'cpu': 0, 'stages': {}, 'chapters': 0,
+                              'images': 0, 'output_size': 0, 'peak_rss': None}
+                if best is None or (result['success'] and (not best['success'] or result['total'] < best['total'])):
+                    best = result
+            best['files'] = html_count
+            best['files_per_sec'] = html_count / best['total'] if best['total'] else 0
+            results[name] = best
+            print(f"  {name}: {best['total']:.3f}秒, {best['files_per_sec']:.1f} 文件/秒")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def format_results(results):
+    """格式化测试结果"""
+    lines = []
+    lines.append("=" * 60)
+    lines.append("性能测试结果")
+    lines.append("=" * 60)
+    for name, result in results.items():
+        lines.append(f"{name}:")
+        if not result['success']:
+            lines.append("  转换失败")
+            continue
+        lines.append(f"  总耗时: {result['total']:.3f}秒 (CPU {result['cpu']:.3f}秒)")
+        lines.append(f"  吞吐量: {result['files_per_sec']:.1f} 文件/秒 ({result['files']} 个文件)")
+        lines.append(f"  章节数: {result['chapters']}, 图片数: {result['images']}")
+        lines.append(f"  输出大小: {result['output_size'] / 1024 / 1024:.2f} MB")
+        if result['peak_rss'] is not None:
+            lines.append(f"  内存峰值(RSS): {result['peak_rss'] / 1024 / 1024:.1f} MB")
+        stages = ', '.join(f"{stage} {seconds:.3f}" for stage, seconds in result['stages'].items())
+        lines.append(f"  各阶段(秒): {stages}")
+    return "\n".join(lines)
+
+
+def add_corpus_arguments(parser):
+    """添加文档集生成参数"""
+    parser.add_argument('--files', type=int, default=200,
+                       help='HTML文件数量（默认: 200）')
+    parser.add_argument('--page-kb', type=int, default=20,
+                       help='每个页面的大约大小，KB（默认: 20）')
+    parser.add_argument('--images', type=int, default=2,
+                       help='每个页面的图片数量（默认: 2）')
+    parser.add_argument('--image-size', type=int, default=256,
+                       help='图片边长，像素（默认: 256）')
+    parser.add_argument('--toc', choices=['nested', 'flat', 'none'], default='nested',
+                       help='目录形式（默认: nested）')
+    parser.add_argument('--depth', type=int, default=2,
+                       help='nested 模式下的目录嵌套层数（默认: 2）')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='随机种子（默认: 0）')
+
+
+def generate_from_args(output_dir, args):
+    """按命令行参数生成文档集"""
+    return generate_corpus(output_dir, files=args.files, page_kb=args.page_kb, images=args.images,
+                           image_size=args.image_size, toc=args.toc, depth=args.depth, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='HTML转EPUB性能测试工具 - 生成合成文档集并测量转换性能',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 生成1000个页面的文档集
+  python benchmark.py generate corpus --files 1000 --images 3
+  
+  # 使用默认选项测试（自动生成临时文档集）
+  python benchmark.py run --files 500
+  
+  # 在已有文档集上对比多组选项，每组运行3次
+  python benchmark.py run --corpus corpus --configs default store max-compress --repeat 3
+        """
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    gen_parser = subparsers.add_parser('generate', help='生成合成HTML文档集')
+    gen_parser.add_argument('output_dir', help='输出目录')
+    add_corpus_arguments(gen_parser)
+    
+    run_parser = subparsers.add_parser('run', help='运行性能测试')
+    run_parser.add_argument('--corpus',
+                           help='使用已有的文档集目录（不指定时按参数生成临时文档集）')
+    run_parser.add_argument('--configs', nargs='+', choices=list(BENCHMARK_CONFIGS), default=['default'],
+                           help='要测试的选项组合（默认: default）')
+    run_parser.add_argument('--repeat', type=int, default=1,
+                           help='每组选项的运行次数，取最快的一次（默认: 1）')
+    run_parser.add_argument('--json',
+                           help='将结果保存为JSON文件')
+    add_corpus_arguments(run_parser)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'generate':
+        count = generate_from_args(args.output_dir, args)
+        print(f"已生成 {count} 个HTML文件: {args.output_dir}")
+        return
+    
+    corpus_dir = args.corpus
+    temp_dir = None
+    if not corpus_dir:
+        temp_dir = tempfile.mkdtemp(prefix='html_to_epub_corpus_')
+        corpus_dir = temp_dir
+        count = generate_from_args(corpus_dir, args)
+        print(f"已生成临时文档集: {count} 个HTML文件")
+    
+    try:
+        print("开始测试...")
+        results = run_benchmark(corpus_dir, args.configs, repeat=args.repeat)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,14 +10,458 @@ import re
 import argparse
 import json
 from pathlib import Path
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
 from ebooklib import epub
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, unquote
 from PIL import Image
 import io
+import hashlib
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# HTML文件扩展名
+HTML_EXTENSIONS = ('.html', '.htm')
+# 拆分章节时作为边界的标题标签
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# 拆分章节时可以展开的布局容器（表格、列表、预格式文本等不能拆开）
+WRAPPER_TAGS = ('div', 'section', 'article', 'main')
+# 章节内容中的元素id和带锚点的链接（用于修正拆分后章节之间的锚点）
+ID_PATTERN = re.compile(r'\sid="([^"]+)"')
+ANCHOR_LINK_PATTERN = re.compile(r'href="([^"#]*)#([^"]*)"')
+# 默认的单个章节最大字节数（超过时按标题拆分）
+DEFAULT_MAX_CHAPTER_SIZE = 512 * 1024
+# 分卷方式的默认限制: 按章节数为每卷章节数，按大小为每卷MB数
+DEFAULT_VOLUME_LIMITS = {'count': 500, 'size': 100}
+# 文本内容的默认压缩级别（0-9）
+DEFAULT_COMPRESS_LEVEL = 6
+# 本身已经压缩过的文件类型，打包时直接存储不再压缩
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp',
+                     '.woff', '.woff2', '.mp3', '.mp4', '.m4a', '.ogg')
+
+
+class FileIndex:
+    """
+    输入目录的文件索引
+    
+    只扫描一次输入目录，记录每个文件的规范化路径、大小和修改时间，
+    之后所有的路径查找都通过字典完成，避免反复调用 resolve()/exists()/is_file()
+    """
+    
+    def __init__(self, root):
+        """
+        初始化并扫描目录
+        
+        Args:
+            root: 要扫描的根目录
+        """
+        self.root = self.normalize(root)
+        # 规范化路径 -> (大小, 修改时间)
+        self.entries = {}
+        # 扫描到的HTML文件（Path对象）
+        self.html_files = []
+        # 根目录之外的路径查询结果缓存（规范化路径 -> 是否为文件）
+        self._outside_cache = {}
+        self._scan()
+    
+    @staticmethod
+    def normalize(path):
+        """将路径转换为规范化的绝对路径字符串，用作索引键"""
+        return os.path.normcase(os.path.abspath(path))
+    
+    def _scan(self):
+        """使用 os.scandir 遍历整个目录树，复用 DirEntry 中的类型信息"""
+        stack = [self.root]
+        visited_dirs = set()
+        while stack:
+            current = stack.pop()
+            try:
+                real_dir = os.path.realpath(current)
+                if real_dir in visited_dirs:
+                    # 防止符号链接造成循环
+                    continue
+                visited_dirs.add(real_dir)
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir():
+                                stack.append(entry.path)
+                            elif entry.is_file():
+                                stat = entry.stat()
+                                key = self.normalize(entry.path)
+                                self.entries[key] = (stat.st_size, stat.st_mtime)
+                                if entry.name.lower().endswith(HTML_EXTENSIONS):
+                                    self.html_files.append(Path(entry.path))
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"扫描目录失败 {current}: {str(e)}")
+    
+    def is_file(self, key):
+        """判断规范化路径是否为文件（根目录外的路径只检查一次并缓存）"""
+        if key in self.entries:
+            return True
+        if key.startswith(self.root + os.sep):
+            return False
+        if key not in self._outside_cache:
+            self._outside_cache[key] = os.path.isfile(key)
+        return self._outside_cache[key]
+    
+    def key_of(self, path):
+        """获取文件对应的索引键"""
+        return self.normalize(path)
+    
+    def relative_path(self, path):
+        """获取文件相对于根目录的路径，索引中的路径是绝对路径，不能直接对输入目录调用 relative_to"""
+        return Path(os.path.relpath(path, self.root))
+    
+    def lookup(self, base_file, href):
+        """
+        解析相对于 base_file 的链接
+        
+        Args:
+            base_file: 链接所在的文件
+            href: 链接地址（可包含锚点和查询参数）
+            
+        Returns:
+            存在的文件的规范化路径，不存在时返回 None
+        """
+        path = urlparse(href).path
+        if not path:
+            return None
+        candidates = [path]
+        if '%' in path:
+            candidates.append(unquote(path))
+        for candidate in candidates:
+            key = self.normalize(os.path.join(os.path.dirname(str(base_file)), candidate))
+            if self.is_file(key):
+                return key
+        return None
+    
+    def size_of(self, key):
+        """获取文件大小，不在索引中时返回0"""
+        entry = self.entries.get(key)
+        return entry[0] if entry else 0
+    
+    def mtime_of(self, key):
+        """获取文件修改时间，不在索引中时返回0"""
+        entry = self.entries.get(key)
+        return entry[1] if entry else 0
+
+
+class ImageCache:
+    """
+    图片处理结果缓存
+    
+    按图片内容的哈希保存转换后的数据，存放在磁盘目录中，
+    因此可以在多个分卷、多本书以及多个工作进程之间共享
+    """
+    
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir: 缓存目录
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def get(self, digest, ext):
+        """读取缓存的数据，不存在时返回None"""
+        cache_file = self.cache_dir / f'{digest}{ext}'
+        try:
+            with open(cache_file, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def put(self, digest, ext, data):
+        """写入缓存（先写临时文件再重命名，避免其他进程读到不完整的数据）"""
+        cache_file = self.cache_dir / f'{digest}{ext}'
+        tmp_file = self.cache_dir / f'{digest}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"写入图片缓存失败 {cache_file}: {str(e)}")
+
+
+class ConversionProfiler:
+    """
+    转换过程的性能分析器
+    
+    按阶段（扫描、读取、解析、清理、图片、章节、保存）记录墙钟时间和CPU时间，
+    嵌套的阶段（如清理过程中的图片处理）只计入最内层阶段；同时记录每个文件的耗时、
+    图片处理前后的字节数，以及 tracemalloc 统计的内存峰值
+    """
+    
+    STAGES = ('scan', 'read', 'parse', 'clean', 'image', 'chapter', 'toc', 'write')
+    STAGE_NAMES = {
+        'scan': '扫描与排序',
+        'read': '读取文件',
+        'parse': '解析HTML',
+        'clean': '清理HTML',
+        'image': '图片处理',
+        'chapter': '创建章节',
+        'toc': '生成目录',
+        'write': '保存EPUB',
+    }
+    
+    def __init__(self, top_n=10, trace_memory=True):
+        """
+        Args:
+            top_n: 报告中列出的最慢文件数量
+            trace_memory: 是否用 tracemalloc 统计内存峰值（会拖慢转换，只测耗时可关闭）
+        """
+        self.top_n = top_n
+        self.trace_memory = trace_memory
+        # 阶段 -> {'wall': 秒, 'cpu': 秒, 'count': 次数}
+        self.stages = {name: {'wall': 0.0, 'cpu': 0.0, 'count': 0} for name in self.STAGES}
+        # 文件 -> {'size': 字节数, 'wall': 秒, 'cpu': 秒, 'stages': {阶段: 墙钟秒数}}
+        self.files = {}
+        self.image_bytes_in = 0
+        self.image_bytes_out = 0
+        self.image_count = 0
+        self.peak_memory = 0
+        self.total_wall = 0.0
+        self.total_cpu = 0.0
+        # 正在计时的阶段栈 [[子阶段墙钟时间, 子阶段CPU时间, 文件], ...]
+        self._stack = []
+        self._start = None
+    
+    def start(self):
+        """开始分析（启动 tracemalloc）"""
+        if self.trace_memory:
+            tracemalloc.start()
+        self._start = (time.perf_counter(), time.process_time())
+    
+    def stop(self):
+        """结束分析，记录总耗时和内存峰值"""
+        if self._start is None:
+            return
+        self.total_wall = time.perf_counter() - self._start[0]
+        self.total_cpu = time.process_time() - self._start[1]
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self._start = None
+    
+    def _file_stats(self, html_file):
+        return self.files.setdefault(str(html_file), {'size': 0, 'wall': 0.0, 'cpu': 0.0, 'stages': {}})
+    
+    @contextmanager
+    def stage(self, name, html_file=None):
+        """记录一个阶段的耗时（只计算不包含子阶段的部分），子阶段沿用外层阶段的文件"""
+        outer_file = self._stack[-1][2] if self._stack else None
+        self._stack.append([0.0, 0.0, html_file if html_file is not None else outer_file])
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            child_wall, child_cpu, current_file = self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += wall
+                self._stack[-1][1] += cpu
+            
+            stage = self.stages[name]
+            stage['wall'] += wall - child_wall
+            stage['cpu'] += cpu - child_cpu
+            stage['count'] += 1
+            
+            if current_file is not None:
+                file_stats = self._file_stats(current_file)
+                file_stats['stages'][name] = file_stats['stages'].get(name, 0.0) + wall - child_wall
+                # 文件总耗时只在最外层阶段累计，避免重复计算子阶段
+                if outer_file is None:
+                    file_stats['wall'] += wall
+                    file_stats['cpu'] += cpu
+    
+    def add_file_size(self, html_file, size):
+        """记录文件大小"""
+        self._file_stats(html_file)['size'] = size
+    
+    def add_image(self, bytes_in, bytes_out):
+        """记录图片处理前后的字节数"""
+        self.image_count += 1
+        self.image_bytes_in += bytes_in
+        self.image_bytes_out += bytes_out
+    
+    def slowest_files(self):
+        """耗时最长的 top_n 个文件"""
+        slowest = sorted(self.files.items(), key=lambda item: item[1]['wall'], reverse=True)[:self.top_n]
+        return [{'path': path, 'wall': round(stat['wall'], 4), 'size': stat['size']} for path, stat in slowest]
+    
+    def report(self):
+        """生成JSON格式的分析报告"""
+        return {
+            'total': {'wall': round(self.total_wall, 4), 'cpu': round(self.total_cpu, 4)},
+            'stages': {name: {'wall': round(stat['wall'], 4), 'cpu': round(stat['cpu'], 4), 'count': stat['count']}
+                       for name, stat in self.stages.items()},
+            'files': {path: {'size': stat['size'], 'wall': round(stat['wall'], 4), 'cpu': round(stat['cpu'], 4),
+                             'stages': {k: round(v, 4) for k, v in stat['stages'].items()}}
+                      for path, stat in self.files.items()},
+            'slowest_files': self.slowest_files(),
+            'images': {'count': self.image_count, 'bytes_in': self.image_bytes_in,
+                       'bytes_out': self.image_bytes_out},
+            'peak_memory': self.peak_memory,
+        }
+    
+    def summary(self):
+        """生成便于阅读的摘要"""
+        lines = []
+        lines.append("=" * 60)
+        lines.append("性能分析报告")
+        lines.append("=" * 60)
+        lines.append(f"总耗时: {self.total_wall:.3f}秒 (CPU {self.total_cpu:.3f}秒)")
+        lines.append(f"内存峰值: {self.peak_memory / 1024 / 1024:.2f} MB")
+        lines.append(f"图片: {self.image_count} 个, 处理前 {self.image_bytes_in / 1024:.1f} KB, "
+                     f"处理后 {self.image_bytes_out / 1024:.1f} KB")
+        lines.append("")
+        lines.append("各阶段耗时:")
+        for name in self.STAGES:
+            stat = self.stages[name]
+            ratio = stat['wall'] / self.total_wall * 100 if self.total_wall else 0
+            lines.append(f"  {self.STAGE_NAMES[name]}: {stat['wall']:.3f}秒 (CPU {stat['cpu']:.3f}秒, "
+                         f"{ratio:.1f}%, {stat['count']} 次)")
+        
+        slowest = self.slowest_files()
+        if slowest:
+            lines.append("")
+            lines.append(f"最慢的 {len(slowest)} 个文件:")
+            for item in slowest:
+                lines.append(f"  {item['wall']:.3f}秒  {item['size'] / 1024:.1f} KB  {item['path']}")
+        return "\n".join(lines)
+    
+    def save(self, report_file):
+        """保存JSON报告"""
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+class ParallelEpubWriter(epub.EpubWriter):
+    """
+    EPUB打包器
+    
+    按文件类型决定压缩策略：图片等已压缩的文件直接存储，文本按指定级别压缩，
+    各个条目在线程池中并行压缩，按固定顺序轮到时立即写入ZIP并释放原始数据，
+    mimetype 始终是第一个且不压缩的条目
+    """
+    
+    def __init__(self, name, book, options=None, compress_level=DEFAULT_COMPRESS_LEVEL, workers=None):
+        super().__init__(name, book, options)
+        self.compress_level = compress_level
+        self.workers = workers
+        # [(条目名称, 数据)]，按写入顺序排列
+        self.entries = []
+    
+    def writestr(self, name, data, compress_type=None):
+        """收集 EpubWriter 写出的条目（代替 zipfile.ZipFile.writestr）"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.entries.append((name, data))
+    
+    def close(self):
+        pass
+    
+    def _compress_entry(self, index):
+        """压缩单个条目，返回 (名称, 压缩方式, CRC, 原始大小, 数据)，压缩后不再保留原始数据"""
+        name, data = self.entries[index]
+        self.entries[index] = None
+        crc = zlib.crc32(data) & 0xFFFFFFFF
+        if name == 'mimetype' or self.compress_level == 0 or name.lower().endswith(STORED_EXTENSIONS):
+            return name, 0, crc, len(data), data
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) >= len(data):
+            # 压缩后反而更大，直接存储
+            return name, 0, crc, len(data), data
+        return name, 8, crc, len(data), compressed
+    
+    def write(self):
+        # 先收集所有条目，mimetype 必须是第一个条目
+        self.out = self
+        self.writestr('mimetype', 'application/epub+zip')
+        self._write_container()
+        self._write_opf()
+        self._write_items()
+        
+        if self._needs_zip64():
+            # 超出普通ZIP格式的限制时交给 zipfile 处理
+            self._write_with_zipfile()
+            return
+        
+        now = time.localtime()
+        dos_time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+        dos_date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+        
+        central_directory = []
+        offset = 0
+        with open(self.file_name, 'wb') as f, ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # 按条目顺序取结果，每个条目写出后即可释放，不会同时保留全部压缩数据
+            for name, method, crc, size, data in executor.map(self._compress_entry, range(len(self.entries))):
+                name_bytes = name.encode('utf-8')
+                # 本地文件头，0x0800 表示文件名使用UTF-8编码
+                header = struct.pack('<IHHHHHIIIHH', 0x04034B50, 20, 0x0800, method,
+                                     dos_time, dos_date, crc, len(data), size, len(name_bytes), 0)
+                f.write(header)
+                f.write(name_bytes)
+                f.write(data)
+                central_directory.append(struct.pack(
+                    '<IHHHHHHIIIHHHHHII', 0x02014B50, 20, 20, 0x0800, method, dos_time, dos_date,
+                    crc, len(data), size, len(name_bytes), 0, 0, 0, 0, 0, offset) + name_bytes)
+                offset += len(header) + len(name_bytes) + len(data)
+            
+            central_data = b''.join(central_directory)
+            f.write(central_data)
+            f.write(struct.pack('<IHHHHIIH', 0x06054B50, 0, 0, len(central_directory),
+                                len(central_directory), len(central_data), offset, 0))
+    
+    def _needs_zip64(self):
+        """
+        判断是否超出普通ZIP格式（4GB、65535个条目）的限制
+        
+        在压缩之前按原始大小判断：写入的数据不会比原始数据大，因此结果是保守的
+        """
+        if len(self.entries) >= 0xFFFF:
+            return True
+        total = 0
+        for name, data in self.entries:
+            total += 30 + 46 + 2 * len(name.encode('utf-8')) + len(data)
+            if len(data) >= 0xFFFFFFFF:
+                return True
+        return total >= 0xFFFFFFFF
+    
+    def _write_with_zipfile(self):
+        """使用 zipfile 顺序写出（支持ZIP64）"""
+        import zipfile
+        with zipfile.ZipFile(self.file_name, 'w', zipfile.ZIP_DEFLATED,
+                             compresslevel=self.compress_level, allowZip64=True) as out:
+            for name, data in self.entries:
+                stored = (name == 'mimetype' or self.compress_level == 0
+                          or name.lower().endswith(STORED_EXTENSIONS))
+                out.writestr(name, data, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+
+
+def write_epub(output_file, book, compress_level=DEFAULT_COMPRESS_LEVEL, workers=None):
+    """使用 ParallelEpubWriter 保存EPUB文件"""
+    writer = ParallelEpubWriter(str(output_file), book, {}, compress_level=compress_level, workers=workers)
+    writer.process()
+    writer.write()
+    return True
+
 
 class HtmlToEpub:
-    def __init__(self, input_dir, output_file, title="电子书", author="未知作者", language="zh-CN"):
+    def __init__(self, input_dir, output_file, title="电子书", author="未知作者", language="zh-CN",
+                 max_chapter_size=DEFAULT_MAX_CHAPTER_SIZE, image_cache=None,
+                 compress_level=DEFAULT_COMPRESS_LEVEL, workers=None, profiler=None):
         """
         初始化HTML转EPUB转换器
         
@@ -27,12 +471,22 @@ class HtmlToEpub:
             title: 电子书标题
             author: 作者
             language: 语言代码
+            max_chapter_size: 单个章节的最大字节数，超过时按标题拆分（0或None表示不拆分）
+            image_cache: 共享的图片缓存（ImageCache），为None时不缓存
+            compress_level: 文本内容的压缩级别（0-9），图片等已压缩的文件始终直接存储
+            workers: 并行线程/进程数，None时使用CPU核心数
+            profiler: 性能分析器（ConversionProfiler），为None时不分析
         """
         self.input_dir = Path(input_dir)
         self.output_file = Path(output_file)
         self.title = title
         self.author = author
         self.language = language
+        self.max_chapter_size = max_chapter_size
+        self.image_cache = image_cache
+        self.compress_level = compress_level
+        self.workers = workers
+        self.profiler = profiler
         
         # 创建EPUB书籍对象
         self.book = epub.EpubBook()
@@ -45,6 +499,16 @@ class HtmlToEpub:
         
         # 章节列表
         self.chapters = []
+        # 目录条目（章节，或拆分后的 (Section, [子章节]) 元组）
+        self.toc_entries = []
+        # 已转换的文件 [(源文件, 章节)]，拆分的页面只记录第一部分
+        self.converted_files = []
+        # 源文件 -> 章节文件名，在处理前一次性生成，用于改写章节之间的链接
+        self.chapter_files = {}
+        # 拆分的章节: 章节文件名 -> {元素id: 所在部分的文件名}
+        self.anchor_parts = {}
+        # 拆分出的部分 -> 原章节文件名
+        self.part_bases = {}
         # 图片资源
         self.images = {}
         # CSS样式
@@ -53,13 +517,26 @@ class HtmlToEpub:
         self.file_order = {}
         # HTML文件信息 (文件路径 -> (标题, 内容))
         self.html_files_info = {}
+        # 目录层级 (文件路径 -> 父页面文件路径)，来自爬取清单
+        self.toc_parents = {}
+        # 输入目录的文件索引（首次使用时扫描）
+        self.file_index = None
         
+    def _stage(self, name, html_file=None):
+        """性能分析的阶段计时，未启用分析时不做任何事"""
+        if self.profiler:
+            return self.profiler.stage(name, html_file)
+        return nullcontext()
+    
+    def get_file_index(self):
+        """获取输入目录的文件索引，整个转换过程只扫描一次目录"""
+        if self.file_index is None:
+            self.file_index = FileIndex(self.input_dir)
+        return self.file_index
+    
     def get_html_files(self):
         """获取所有HTML文件（不排序，排序由get_ordered_html_files处理）"""
-        html_files = []
-        for ext in ['*.html', '*.htm']:
-            html_files.extend(self.input_dir.rglob(ext))
-        return html_files
+        return list(self.get_file_index().html_files)
     
     def find_toc_in_html(self, html_file):
         """从HTML文件中查找目录结构"""
@@ -97,27 +574,23 @@ class HtmlToEpub:
                 return None
             
             # 提取目录中的链接
+            index = self.get_file_index()
             links = []
             for link in toc_element.find_all('a', href=True):
                 href = link.get('href')
                 if href:
-                    # 处理相对路径
-                    if not urlparse(href).scheme:
-                        # 相对路径，转换为绝对路径
-                        link_path = (html_file.parent / href).resolve()
-                    else:
-                        # 绝对路径或URL
-                        link_path = Path(href)
+                    # 只处理相对路径，外部URL不会是本地章节
+                    if urlparse(href).scheme:
+                        continue
                     
-                    # 检查是否是HTML文件
-                    if link_path.suffix.lower() in ['.html', '.htm']:
-                        # 检查文件是否存在
-                        if link_path.exists():
-                            links.append({
-                                'path': link_path,
-                                'title': link.get_text(strip=True) or link_path.stem,
-                                'href': href
-                            })
+                    # 检查是否是存在的HTML文件
+                    link_key = index.lookup(html_file, href)
+                    if link_key and link_key.lower().endswith(HTML_EXTENSIONS):
+                        links.append({
+                            'path': link_key,
+                            'title': link.get_text(strip=True) or Path(link_key).stem,
+                            'href': href
+                        })
             
             return links if links else None
             
@@ -136,19 +609,20 @@ class HtmlToEpub:
                 return False
             
             # 构建文件路径到顺序的映射
+            index = self.get_file_index()
             for idx, item in enumerate(order_list):
                 if isinstance(item, str):
                     # 简单字符串，作为相对路径
-                    file_path = (self.input_dir / item).resolve()
+                    path_str = item
                 elif isinstance(item, dict):
                     # 字典格式，包含path和title
                     path_str = item.get('path', '')
-                    file_path = (self.input_dir / path_str).resolve()
                 else:
                     continue
                 
-                if file_path.exists():
-                    self.file_order[file_path] = idx
+                file_key = index.key_of(self.input_dir / path_str)
+                if path_str and index.is_file(file_key):
+                    self.file_order[file_key] = idx
             
             return len(self.file_order) > 0
             
@@ -156,6 +630,46 @@ class HtmlToEpub:
             print(f"加载配置文件失败: {str(e)}")
             return False
     
+    def load_order_from_manifest(self, manifest_file):
+        """
+        从DocDownloader的爬取清单加载文件顺序、标题和目录层级
+        
+        清单中的页面按BFS顺序排列，每个页面记录了本地路径、父页面URL和标题，
+        路径相对于清单文件所在目录
+        """
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            print(f"加载爬取清单失败: {str(e)}")
+            return False
+        
+        index = self.get_file_index()
+        base_dir = Path(manifest_file).parent
+        url_to_key = {}
+        for idx, page in enumerate(manifest.get('pages', [])):
+            path_str = page.get('path')
+            if not path_str:
+                continue
+            file_key = index.key_of(base_dir / path_str)
+            if not index.is_file(file_key) or file_key in self.file_order:
+                continue
+            
+            self.file_order[file_key] = idx
+            if page.get('url'):
+                url_to_key[page['url']] = file_key
+            if page.get('title'):
+                self.html_files_info[file_key] = {
+                    'title': page['title'],
+                    'from_toc': True
+                }
+            # BFS顺序保证父页面先于子页面出现
+            parent_key = url_to_key.get(page.get('parent'))
+            if parent_key and parent_key != file_key:
+                self.toc_parents[file_key] = parent_key
+        
+        return len(self.file_order) > 0
+    
     def detect_toc_from_files(self, html_files):
         """从HTML文件中检测目录结构"""
         print("正在检测目录结构...")
@@ -250,11 +764,12 @@ class HtmlToEpub:
             # 按顺序排序
             ordered_files = []
             unordered_files = []
+            index = self.get_file_index()
             
             for html_file in html_files:
-                resolved_path = html_file.resolve()
-                if resolved_path in self.file_order:
-                    ordered_files.append((self.file_order[resolved_path], html_file))
+                file_key = index.key_of(html_file)
+                if file_key in self.file_order:
+                    ordered_files.append((self.file_order[file_key], html_file))
                 else:
                     unordered_files.append(html_file)
             
@@ -284,21 +799,19 @@ class HtmlToEpub:
             comment.extract()
         
         # 处理图片
+        index = self.get_file_index()
         for img in soup.find_all('img'):
             src = img.get('src')
             if src:
-                # 处理相对路径
+                # 只处理相对路径，外部URL的图片无法嵌入
+                img_key = None
                 if not urlparse(src).scheme:
-                    # 相对路径，转换为绝对路径
-                    img_path = (base_path.parent / src).resolve()
-                else:
-                    # 绝对路径或URL
-                    img_path = Path(src)
+                    img_key = index.lookup(base_path, src)
                 
                 # 检查图片是否存在
-                if img_path.exists() and img_path.is_file():
+                if img_key:
                     # 处理图片
-                    img_id = self.process_image(img_path)
+                    img_id = self.process_image(Path(img_key))
                     if img_id:
                         img['src'] = img_id
                     else:
@@ -318,13 +831,17 @@ class HtmlToEpub:
                 parsed = urlparse(href)
                 if parsed.scheme and parsed.scheme not in ['', 'file']:
                     a['href'] = '#'
-                # 如果是本地HTML文件链接，可以保留（但EPUB中可能无法跳转）
                 elif href.startswith('#'):
                     # 锚点链接保留
                     pass
                 else:
-                    # 本地文件链接，移除或改为#
-                    a['href'] = '#'
+                    # 书中其他HTML文件的链接改为对应的章节文件，书外的文件改为#
+                    target_key = index.lookup(base_path, href)
+                    chapter_file = self.chapter_files.get(target_key) if target_key else None
+                    if chapter_file:
+                        a['href'] = f'{chapter_file}#{parsed.fragment}' if parsed.fragment else chapter_file
+                    else:
+                        a['href'] = '#'
         
         # 提取内联样式或添加基本样式
         style_tag = soup.find('style')
@@ -333,8 +850,88 @@ class HtmlToEpub:
         
         return soup
     
+    def split_body(self, body):
+        """
+        按标题边界将过大的正文拆分为多个部分
+        
+        Args:
+            body: 清理后的body标签（或整个文档）
+            
+        Returns:
+            [(标题, HTML片段), ...]，第一部分的标题为None；无需拆分时返回None
+        """
+        if not self.max_chapter_size:
+            return None
+        
+        # 找到实际承载正文的容器（跳过只包含单个布局容器的外层包装）
+        container = body
+        while True:
+            children = [c for c in container.children
+                        if not (isinstance(c, NavigableString) and not c.strip())]
+            if len(children) == 1 and isinstance(children[0], Tag) and children[0].name in WRAPPER_TAGS:
+                container = children[0]
+            else:
+                break
+        
+        # 按标题将子节点分段: [标题, [HTML片段], 字节数]
+        segments = [[None, [], 0]]
+        for child in children:
+            if isinstance(child, Tag) and child.name in HEADING_TAGS and segments[-1][1]:
+                segments.append([child.get_text(strip=True) or None, [], 0])
+            # 文本节点需要按原样转义，str() 会得到反转义后的文本
+            html = child.output_ready(formatter='minimal') if isinstance(child, NavigableString) else str(child)
+            segments[-1][1].append(html)
+            segments[-1][2] += len(html.encode('utf-8'))
+        
+        total_size = sum(size for _, _, size in segments)
+        if total_size <= self.max_chapter_size:
+            return None
+        
+        # 合并相邻小段，使每部分不超过限制；单个过大的段按子节点继续拆分
+        parts = []
+        current_title, current_html, current_size = None, [], 0
+        for seg_title, seg_html, seg_size in segments:
+            if current_html and current_size + seg_size > self.max_chapter_size:
+                parts.append((current_title, ''.join(current_html)))
+                current_title, current_html, current_size = seg_title, [], 0
+            elif not current_html and parts:
+                current_title = seg_title
+            for html in seg_html:
+                html_size = len(html.encode('utf-8'))
+                if current_html and current_size + html_size > self.max_chapter_size:
+                    parts.append((current_title, ''.join(current_html)))
+                    current_title, current_html, current_size = seg_title, [], 0
+                current_html.append(html)
+                current_size += html_size
+        if current_html:
+            parts.append((current_title, ''.join(current_html)))
+        
+        if len(parts) < 2:
+            return None
+        return parts
+    
+    def build_xhtml(self, title, body_content):
+        """生成完整的XHTML章节内容"""
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+    <meta http-equiv="Content-Type" content="text/html; charset=utf-8"/>
+    <title>{title}</title>
+    <link rel="stylesheet" type="text/css" href="style/nav.css"/>
+</head>
+<body>
+{body_content}
+</body>
+</html>"""
+    
     def process_image(self, img_path):
         """处理图片，添加到EPUB中并返回图片ID"""
+        with self._stage('image'):
+            return self._process_image(img_path)
+    
+    def _process_image(self, img_path):
+        """处理图片的具体实现"""
         try:
             # 检查是否已处理过
             img_str = str(img_path)
@@ -349,17 +946,25 @@ class HtmlToEpub:
             ext = img_path.suffix.lower()
             if ext not in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg']:
                 return None
+            bytes_in = len(img_data)
             
-            # 转换webp为png（如果支持）
+            # 转换webp为png（如果支持），转换结果按内容哈希缓存
             if ext == '.webp':
-                try:
-                    img = Image.open(io.BytesIO(img_data))
-                    output = io.BytesIO()
-                    img.save(output, format='PNG')
-                    img_data = output.getvalue()
-                    ext = '.png'
-                except:
-                    return None
+                digest = hashlib.sha1(img_data).hexdigest()
+                cached = self.image_cache.get(digest, '.png') if self.image_cache else None
+                if cached is not None:
+                    img_data = cached
+                else:
+                    try:
+                        img = Image.open(io.BytesIO(img_data))
+                        output = io.BytesIO()
+                        img.save(output, format='PNG')
+                        img_data = output.getvalue()
+                    except:
+                        return None
+                    if self.image_cache:
+                        self.image_cache.put(digest, '.png', img_data)
+                ext = '.png'
             
             # 生成图片ID
             img_id = f'image_{len(self.images)}'
@@ -385,6 +990,8 @@ class HtmlToEpub:
             
             # 保存映射
             self.images[img_str] = f'images/{img_id}{ext}'
+            if self.profiler:
+                self.profiler.add_image(bytes_in, len(img_data))
             
             return f'images/{img_id}{ext}'
             
@@ -392,12 +999,14 @@ class HtmlToEpub:
             print(f"处理图片失败 {img_path}: {str(e)}")
             return None
     
-    def create_chapter(self, html_file, content):
-        """创建EPUB章节"""
+    def create_chapter(self, html_file, content, title=None, file_name=None):
+        """创建EPUB章节（指定title时直接使用该标题，未指定file_name时按章节序号命名）"""
         # 尝试从目录信息中获取标题，否则使用文件名
-        resolved_path = html_file.resolve()
-        if resolved_path in self.html_files_info:
-            chapter_title = self.html_files_info[resolved_path].get('title', html_file.stem)
+        file_key = self.get_file_index().key_of(html_file)
+        if title:
+            chapter_title = title
+        elif file_key in self.html_files_info:
+            chapter_title = self.html_files_info[file_key].get('title', html_file.stem)
         else:
             # 尝试从HTML内容中提取标题
             try:
@@ -417,7 +1026,7 @@ class HtmlToEpub:
         # 创建章节
         chapter = epub.EpubHtml(
             title=chapter_title,
-            file_name=f'chapter_{len(self.chapters)}.xhtml',
+            file_name=file_name or f'chapter_{len(self.chapters)}.xhtml',
             lang=self.language
         )
         
@@ -430,6 +1039,68 @@ class HtmlToEpub:
         
         return chapter
     
+    def add_chapters(self, html_file, cleaned_soup):
+        """将清理后的文档创建为章节，过大的页面按标题拆分为多个章节"""
+        # 获取body内容
+        body = cleaned_soup.find('body')
+        if not body:
+            # 如果没有body标签，使用整个文档
+            body = cleaned_soup
+        
+        file_name = self.chapter_files.get(self.get_file_index().key_of(html_file))
+        
+        # 过大的页面按标题拆分为多个章节
+        parts = self.split_body(body)
+        if not parts:
+            chapter = self.create_chapter(html_file, self.build_xhtml(html_file.stem, str(body)),
+                                          file_name=file_name)
+            self.toc_entries.append(chapter)
+            self.converted_files.append((html_file, chapter))
+            return
+        
+        print(f"  页面过大，拆分为 {len(parts)} 个部分")
+        _, first_html = parts[0]
+        parent = self.create_chapter(html_file, self.build_xhtml(html_file.stem, first_html),
+                                     file_name=file_name)
+        self.converted_files.append((html_file, parent))
+        
+        # 记录每个元素id所在的部分，链接到原页面锚点时据此修正
+        base_name = parent.file_name
+        anchors = {anchor: base_name for anchor in ID_PATTERN.findall(first_html)}
+        sub_chapters = [parent]
+        for part_idx, (part_title, part_html) in enumerate(parts[1:], 2):
+            part_title = part_title or f"{parent.title} ({part_idx})"
+            part_name = f'{base_name[:-len(".xhtml")]}_{part_idx}.xhtml'
+            sub_chapters.append(self.create_chapter(
+                html_file, self.build_xhtml(html_file.stem, part_html), title=part_title, file_name=part_name))
+            self.part_bases[part_name] = base_name
+            for anchor in ID_PATTERN.findall(part_html):
+                anchors.setdefault(anchor, part_name)
+        self.anchor_parts[base_name] = anchors
+        self.toc_entries.append((epub.Section(parent.title, href=parent.file_name), sub_chapters))
+    
+    def fix_split_anchors(self):
+        """将指向拆分章节锚点的链接改为锚点实际所在的部分"""
+        if not self.anchor_parts:
+            return
+        
+        for chapter in self.chapters:
+            own_base = self.part_bases.get(chapter.file_name, chapter.file_name)
+            
+            def replace_link(match):
+                target, anchor = match.group(1), match.group(2)
+                part_name = self.anchor_parts.get(target or own_base, {}).get(anchor)
+                if not part_name:
+                    return match.group(0)
+                if part_name == chapter.file_name:
+                    return f'href="#{anchor}"'
+                return f'href="{part_name}#{anchor}"'
+            
+            content = chapter.content.decode('utf-8')
+            fixed_content = ANCHOR_LINK_PATTERN.sub(replace_link, content)
+            if fixed_content != content:
+                chapter.content = fixed_content.encode('utf-8')
+    
     def add_default_css(self):
         """添加默认CSS样式"""
         default_css = """
@@ -501,8 +1172,8 @@ class HtmlToEpub:
         for chapter in self.chapters:
             chapter.add_item(nav_css)
     
-    def convert(self, order_config=None):
-        """执行转换"""
+    def prepare_files(self, order_config=None, manifest=None):
+        """扫描输入目录并确定章节顺序，返回排序后的HTML文件列表（失败时返回None）"""
         print(f"开始转换HTML文件为EPUB...")
         print(f"输入目录: {self.input_dir}")
         print(f"输出文件: {self.output_file}")
@@ -515,12 +1186,19 @@ class HtmlToEpub:
         
         if not html_files:
             print("错误: 未找到任何HTML文件！")
-            return False
+            return None
         
         print(f"找到 {len(html_files)} 个HTML文件")
         
+        # 爬取清单中已有页面顺序、标题和层级，不需要再检测目录
+        if manifest:
+            if self.load_order_from_manifest(manifest):
+                print(f"已从爬取清单加载文件顺序: {len(self.file_order)} 个文件")
+            else:
+                print(f"警告: 爬取清单中没有可用的页面: {manifest}")
+        
         # 尝试加载配置文件中的顺序
-        if order_config and Path(order_config).exists():
+        if not self.file_order and order_config and Path(order_config).exists():
             if self.load_order_from_config(order_config):
                 print(f"已从配置文件加载文件顺序: {len(self.file_order)} 个文件")
         
@@ -539,6 +1217,14 @@ class HtmlToEpub:
             print(f"将按照文件名顺序处理文件")
         
         print("-" * 60)
+        return ordered_files
+    
+    def build_book(self, ordered_files):
+        """按顺序将HTML文件转换为章节并保存EPUB文件"""
+        # 先确定每个文件对应的章节文件名，处理时链接可以直接指向后面的章节
+        index = self.get_file_index()
+        self.chapter_files = {index.key_of(html_file): f'chapter_{i}.xhtml'
+                              for i, html_file in enumerate(ordered_files)}
         
         # 处理每个HTML文件
         for i, html_file in enumerate(ordered_files, 1):
@@ -546,39 +1232,23 @@ class HtmlToEpub:
             
             try:
                 # 读取HTML文件
-                with open(html_file, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
+                with self._stage('read', html_file):
+                    with open(html_file, 'r', encoding='utf-8') as f:
+                        html_content = f.read()
+                if self.profiler:
+                    self.profiler.add_file_size(html_file, len(html_content.encode('utf-8')))
                 
                 # 解析HTML
-                soup = BeautifulSoup(html_content, 'html.parser')
-                
-                # 清理HTML
-                cleaned_soup = self.clean_html(soup, html_file)
-                
-                # 获取body内容
-                body = cleaned_soup.find('body')
-                if not body:
-                    # 如果没有body标签，使用整个文档
-                    body_content = str(cleaned_soup)
-                else:
-                    body_content = str(body)
+                with self._stage('parse', html_file):
+                    soup = BeautifulSoup(html_content, 'html.parser')
                 
-                # 创建完整的XHTML内容
-                xhtml_content = f"""<?xml version="1.0" encoding="UTF-8"?>
-<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN" "http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">
-<html xmlns="http://www.w3.org/1999/xhtml">
-<head>
-    <meta http-equiv="Content-Type" content="text/html; charset=utf-8"/>
-    <title>{html_file.stem}</title>
-    <link rel="stylesheet" type="text/css" href="style/nav.css"/>
-</head>
-<body>
-{body_content}
-</body>
-</html>"""
+                # 清理HTML（图片处理单独计时）
+                with self._stage('clean', html_file):
+                    cleaned_soup = self.clean_html(soup, html_file)
                 
                 # 创建章节
-                self.create_chapter(html_file, xhtml_content)
+                with self._stage('chapter', html_file):
+                    self.add_chapters(html_file, cleaned_soup)
                 
             except Exception as e:
                 print(f"处理文件失败 {html_file}: {str(e)}")
@@ -588,15 +1258,19 @@ class HtmlToEpub:
             print("错误: 没有成功创建任何章节！")
             return False
         
-        # 添加默认CSS
-        self.add_default_css()
-        
-        # 创建目录
-        self.book.toc = tuple(self.chapters)
-        
-        # 添加导航文件
-        self.book.add_item(epub.EpubNcx())
-        self.book.add_item(epub.EpubNav())
+        with self._stage('toc'):
+            # 修正指向拆分章节的锚点链接
+            self.fix_split_anchors()
+            
+            # 添加默认CSS
+            self.add_default_css()
+            
+            # 创建目录
+            self.book.toc = self.build_toc()
+            
+            # 添加导航文件
+            self.book.add_item(epub.EpubNcx())
+            self.book.add_item(epub.EpubNav())
         
         # 设置书籍封面（如果有）
         # 可以在这里添加封面图片
@@ -607,7 +1281,8 @@ class HtmlToEpub:
         # 保存EPUB文件
         print("-" * 60)
         print(f"正在保存EPUB文件...")
-        epub.write_epub(self.output_file, self.book, {})
+        with self._stage('write'):
+            write_epub(self.output_file, self.book, compress_level=self.compress_level, workers=self.workers)
         
         print(f"✅ 转换完成！")
         print(f"   输出文件: {self.output_file}")
@@ -615,6 +1290,345 @@ class HtmlToEpub:
         print(f"   图片数: {len(self.images)}")
         
         return True
+    
+    def build_toc(self):
+        """生成目录，有父页面信息时按层级嵌套"""
+        if not self.toc_parents:
+            return tuple(self.toc_entries)
+        
+        # toc_entries 与 converted_files 一一对应
+        index = self.get_file_index()
+        keys = [index.key_of(html_file) for html_file, _ in self.converted_files]
+        positions = {key: pos for pos, key in enumerate(keys)}
+        entries = dict(zip(keys, self.toc_entries))
+        children = {key: [] for key in keys}
+        roots = []
+        for key in keys:
+            parent_key = self.toc_parents.get(key)
+            # 父页面必须在当前页面之前，避免配置错误导致循环
+            if parent_key in positions and positions[parent_key] < positions[key]:
+                children[parent_key].append(key)
+            else:
+                roots.append(key)
+        
+        def make_entry(key):
+            entry = entries[key]
+            if not children[key]:
+                return entry
+            sub_entries = [make_entry(child) for child in children[key]]
+            if isinstance(entry, tuple):
+                # 已拆分的章节，子页面接在拆分的部分之后
+                section, parts = entry
+                return (section, list(parts) + sub_entries)
+            return (epub.Section(entry.title, href=entry.file_name), sub_entries)
+        
+        return tuple(make_entry(key) for key in roots)
+    
+    def convert(self, order_config=None, manifest=None):
+        """执行转换"""
+        if self.profiler:
+            self.profiler.start()
+        try:
+            with self._stage('scan'):
+                ordered_files = self.prepare_files(order_config, manifest)
+            if not ordered_files:
+                return False
+            return self.build_book(ordered_files)
+        finally:
+            if self.profiler:
+                self.profiler.stop()
+    
+    def plan_volumes(self, ordered_files, split_by, limit):
+        """
+        将排序后的文件划分为多个分卷
+        
+        Args:
+            ordered_files: 排序后的HTML文件列表
+            split_by: 分卷方式 count（章节数）、size（大小，MB）或 section（顶层目录）
+            limit: 每卷的章节数或MB数（section方式忽略）
+            
+        Returns:
+            [(分卷名称, [文件, ...]), ...]
+        """
+        volumes = []
+        index = self.get_file_index()
+        if split_by == 'section':
+            # 按输入目录下的顶层子目录分组，根目录中的文件单独成卷
+            sections = {}
+            for html_file in ordered_files:
+                relative_parts = index.relative_path(html_file).parts
+                section = relative_parts[0] if len(relative_parts) > 1 else ''
+                sections.setdefault(section, []).append(html_file)
+            for section, files in sections.items():
+                volumes.append((section, files))
+            return volumes
+        
+        limit_bytes = limit * 1024 * 1024
+        current = []
+        current_size = 0
+        for html_file in ordered_files:
+            file_size = index.size_of(index.key_of(html_file))
+            if current:
+                if split_by == 'count' and len(current) >= limit:
+                    volumes.append(('', current))
+                    current, current_size = [], 0
+                elif split_by == 'size' and current_size + file_size > limit_bytes:
+                    volumes.append(('', current))
+                    current, current_size = [], 0
+            current.append(html_file)
+            current_size += file_size
+        if current:
+            volumes.append(('', current))
+        return volumes
+    
+    def convert_volumes(self, order_config=None, split_by='count', limit=None, workers=None, manifest=None):
+        """
+        分卷转换：每个分卷在独立的工作进程中并行生成，图片处理结果在分卷间共享
+        
+        Args:
+            order_config: 章节顺序配置文件
+            split_by: 分卷方式 count、size 或 section
+            limit: 每卷的章节数或MB数，None时使用默认值
+            workers: 工作进程数，None时使用CPU核心数
+            manifest: DocDownloader的爬取清单
+        """
+        ordered_files = self.prepare_files(order_config, manifest)
+        if not ordered_files:
+            return False
+        
+        if limit is None:
+            limit = DEFAULT_VOLUME_LIMITS.get(split_by, 0)
+        volumes = self.plan_volumes(ordered_files, split_by, limit)
+        print(f"共分为 {len(volumes)} 卷")
+        
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_dir = tempfile.mkdtemp(prefix='html_to_epub_images_')
+        stem, suffix = self.output_file.stem, self.output_file.suffix or '.epub'
+        jobs = []
+        for vol_idx, (section, files) in enumerate(volumes, 1):
+            vol_title = f"{self.title} - {section}" if section else f"{self.title} 第{vol_idx}卷"
+            jobs.append({
+                'volume': vol_idx,
+                'title': vol_title,
+                'output_file': str(self.output_file.with_name(f'{stem}_vol{vol_idx:02d}{suffix}')),
+                'files': [str(f) for f in files],
+            })
+        
+        results = []
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers or self.workers,
+                initializer=_init_volume_worker,
+                initargs=(self._volume_settings(), self.get_file_index(), self.file_order,
+                          self.html_files_info, self.toc_parents, cache_dir)
+            ) as executor:
+                futures = {executor.submit(_build_volume, job): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        print(f"生成分卷失败 {job['output_file']}: {str(e)}")
+                        results.append({'volume': job['volume'], 'title': job['title'],
+                                        'output_file': job['output_file'], 'success': False,
+                                        'chapters': []})
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        
+        results.sort(key=lambda r: r['volume'])
+        self.write_volume_index(results)
+        
+        failed = [r for r in results if not r['success']]
+        print("-" * 60)
+        print(f"✅ 分卷转换完成！成功 {len(results) - len(failed)} 卷，失败 {len(failed)} 卷")
+        return not failed
+    
+    def _volume_settings(self):
+        """分卷工作进程创建转换器所需的参数"""
+        return {
+            'input_dir': str(self.input_dir),
+            'author': self.author,
+            'language': self.language,
+            'max_chapter_size': self.max_chapter_size,
+            'compress_level': self.compress_level,
+        }
+    
+    def write_volume_index(self, results):
+        """保存分卷索引：每卷包含哪些章节，以及每个源文件所在的分卷"""
+        index_file = self.output_file.with_name(f'{self.output_file.stem}_volumes.json')
+        chapter_index = {}
+        for result in results:
+            for chapter in result['chapters']:
+                chapter_index[chapter['source']] = result['volume']
+        index_data = {
+            'title': self.title,
+            'volumes': results,
+            'chapter_index': chapter_index,
+        }
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(index_data, f, ensure_ascii=False, indent=2)
+        print(f"分卷索引已保存到: {index_file}")
+
+
+# 分卷工作进程中共享的状态（由 _init_volume_worker 设置）
+_volume_worker_state = {}
+
+
+def _init_volume_worker(settings, file_index, file_order, html_files_info, toc_parents, cache_dir):
+    """分卷工作进程初始化：只传递一次文件索引和目录信息，避免每卷重新扫描"""
+    _volume_worker_state['settings'] = settings
+    _volume_worker_state['file_index'] = file_index
+    _volume_worker_state['file_order'] = file_order
+    _volume_worker_state['html_files_info'] = html_files_info
+    _volume_worker_state['toc_parents'] = toc_parents
+    _volume_worker_state['image_cache'] = ImageCache(cache_dir)
+
+
+def _build_volume(job):
+    """在工作进程中生成一个分卷"""
+    settings = _volume_worker_state['settings']
+    converter = HtmlToEpub(
+        input_dir=settings['input_dir'],
+        output_file=job['output_file'],
+        title=job['title'],
+        author=settings['author'],
+        language=settings['language'],
+        max_chapter_size=settings['max_chapter_size'],
+        image_cache=_volume_worker_state['image_cache'],
+        compress_level=settings['compress_level'],
+        workers=1
+    )
+    converter.file_index = _volume_worker_state['file_index']
+    converter.file_order = _volume_worker_state['file_order']
+    converter.html_files_info = _volume_worker_state['html_files_info']
+    converter.toc_parents = _volume_worker_state['toc_parents']
+    
+    print(f"正在生成第 {job['volume']} 卷: {job['output_file']}")
+    success = converter.build_book([Path(f) for f in job['files']])
+    
+    chapters = []
+    for html_file, chapter in converter.converted_files:
+        chapters.append({
+            'source': converter.get_file_index().relative_path(html_file).as_posix(),
+            'title': chapter.title,
+            'file_name': chapter.file_name,
+        })
+    return {
+        'volume': job['volume'],
+        'title': job['title'],
+        'output_file': job['output_file'],
+        'success': bool(success),
+        'chapters': chapters,
+    }
+
+
+def load_batch_jobs(job_file):
+    """
+    从任务文件加载批量转换任务
+    
+    任务文件格式: {"jobs": [{"input_dir": ..., "output": ..., "title": ..., "author": ...,
+    "language": ..., "config": ..., "manifest": ...}, ...]}，相对路径相对于任务文件所在目录
+    """
+    try:
+        with open(job_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"加载任务文件失败: {str(e)}")
+        return None
+    
+    base_dir = Path(job_file).parent
+    jobs = []
+    for idx, item in enumerate(data.get('jobs', []), 1):
+        if not isinstance(item, dict) or not item.get('input_dir') or not item.get('output'):
+            print(f"警告: 第 {idx} 个任务缺少 input_dir 或 output，已跳过")
+            continue
+        job = dict(item)
+        job['index'] = idx
+        for key in ('input_dir', 'output', 'config', 'manifest'):
+            if job.get(key):
+                job[key] = str(base_dir / job[key])
+        jobs.append(job)
+    return jobs
+
+
+def run_batch(job_file, workers=None, max_chapter_size=DEFAULT_MAX_CHAPTER_SIZE,
+              compress_level=DEFAULT_COMPRESS_LEVEL):
+    """
+    批量转换：所有任务在同一个进程池中并行执行，共享按内容哈希缓存的图片处理结果
+    
+    Args:
+        job_file: 任务文件（JSON格式）
+        workers: 工作进程数，None时使用CPU核心数
+        max_chapter_size: 任务未指定时使用的单章最大字节数
+        compress_level: 任务未指定时使用的压缩级别
+    """
+    jobs = load_batch_jobs(job_file)
+    if not jobs:
+        print("错误: 任务文件中没有有效的任务！")
+        return False
+    
+    print(f"共 {len(jobs)} 个转换任务")
+    print("-" * 60)
+    
+    defaults = {'max_chapter_size': max_chapter_size, 'compress_level': compress_level}
+    cache_dir = tempfile.mkdtemp(prefix='html_to_epub_images_')
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(defaults, cache_dir)) as executor:
+            futures = {executor.submit(_run_batch_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    print(f"任务失败 {job['output']}: {str(e)}")
+                    success = False
+                results.append((job, success))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    
+    results.sort(key=lambda r: r[0]['index'])
+    failed = [job for job, success in results if not success]
+    print("=" * 60)
+    print(f"批量转换完成: 成功 {len(results) - len(failed)} 个，失败 {len(failed)} 个")
+    for job in failed:
+        print(f"  ❌ {job['input_dir']} -> {job['output']}")
+    return not failed
+
+
+# 批量转换工作进程中共享的状态（由 _init_batch_worker 设置）
+_batch_worker_state = {}
+
+
+def _init_batch_worker(defaults, cache_dir):
+    """批量转换工作进程初始化"""
+    _batch_worker_state['defaults'] = defaults
+    _batch_worker_state['image_cache'] = ImageCache(cache_dir)
+
+
+def _run_batch_job(job):
+    """在工作进程中执行一个转换任务"""
+    defaults = _batch_worker_state['defaults']
+    input_path = Path(job['input_dir'])
+    if not input_path.is_dir():
+        print(f"错误: 输入目录不存在: {job['input_dir']}")
+        return False
+    
+    Path(job['output']).parent.mkdir(parents=True, exist_ok=True)
+    max_chapter_size = job.get('max_chapter_size')
+    converter = HtmlToEpub(
+        input_dir=job['input_dir'],
+        output_file=job['output'],
+        title=job.get('title', '电子书'),
+        author=job.get('author', '未知作者'),
+        language=job.get('language', 'zh-CN'),
+        max_chapter_size=max_chapter_size * 1024 if max_chapter_size is not None else defaults['max_chapter_size'],
+        image_cache=_batch_worker_state['image_cache'],
+        compress_level=job.get('compress_level', defaults['compress_level']),
+        workers=1
+    )
+    return converter.convert(order_config=job.get('config'), manifest=job.get('manifest'))
 
 
 def main():
@@ -634,12 +1648,24 @@ def main():
   
   # 使用配置文件指定章节顺序
   python html_to_epub.py docs -o book.epub -c order.json
+  
+  # 分卷输出，每卷200章，4个进程并行生成
+  python html_to_epub.py docs -o book.epub --split-volumes count --volume-limit 200 -j 4
+  
+  # 使用DocDownloader的爬取清单确定章节顺序和目录层级
+  python html_to_epub.py docs -o book.epub -m docs/crawl_manifest.json
+  
+  # 性能分析，输出各阶段耗时和最慢的文件
+  python html_to_epub.py docs -o book.epub --profile
+  
+  # 批量转换任务文件中的所有书籍
+  python html_to_epub.py --batch jobs.json -j 8
         """
     )
     
-    parser.add_argument('input_dir', help='HTML文件所在目录')
-    parser.add_argument('-o', '--output', required=True,
-                       help='输出的EPUB文件路径（必需）')
+    parser.add_argument('input_dir', nargs='?', help='HTML文件所在目录')
+    parser.add_argument('-o', '--output',
+                       help='输出的EPUB文件路径（非批量模式时必需）')
     parser.add_argument('-t', '--title', default='电子书',
                        help='电子书标题（默认: 电子书）')
     parser.add_argument('-a', '--author', default='未知作者',
@@ -648,8 +1674,43 @@ def main():
                        help='语言代码（默认: zh-CN）')
     parser.add_argument('-c', '--config',
                        help='章节顺序配置文件（JSON格式）')
+    parser.add_argument('--max-chapter-size', type=int, default=DEFAULT_MAX_CHAPTER_SIZE // 1024,
+                       help=f'单个章节的最大大小(KB)，超过时按标题拆分，0表示不拆分（默认: {DEFAULT_MAX_CHAPTER_SIZE // 1024}）')
+    parser.add_argument('-m', '--manifest',
+                       help='DocDownloader生成的爬取清单（crawl_manifest.json），用于确定章节顺序、标题和目录层级')
+    parser.add_argument('--split-volumes', choices=['count', 'size', 'section'],
+                       help='分卷输出: count 按章节数、size 按大小、section 按顶层目录')
+    parser.add_argument('--volume-limit', type=int,
+                       help=f'每卷的章节数（count）或MB数（size）（默认: {DEFAULT_VOLUME_LIMITS["count"]} 章 / {DEFAULT_VOLUME_LIMITS["size"]} MB）')
+    parser.add_argument('-j', '--workers', type=int,
+                       help='并行工作进程数（默认: CPU核心数）')
+    parser.add_argument('--compress-level', type=int, choices=range(0, 10), default=DEFAULT_COMPRESS_LEVEL,
+                       metavar='0-9',
+                       help=f'文本内容的压缩级别，0表示不压缩，图片始终不压缩（默认: {DEFAULT_COMPRESS_LEVEL}）')
+    parser.add_argument('--batch', metavar='JOB_FILE',
+                       help='批量转换模式，从任务文件（JSON格式）读取多个转换任务')
+    parser.add_argument('--profile', action='store_true',
+                       help='性能分析模式，记录各阶段和各文件的耗时、图片字节数和内存峰值，报告保存为JSON')
+    parser.add_argument('--profile-report', metavar='REPORT_FILE',
+                       help='性能分析报告的保存路径（默认: 输出文件名_profile.json），指定时自动启用性能分析')
+    parser.add_argument('--profile-top', type=int, default=10,
+                       help='性能分析报告中列出的最慢文件数（默认: 10）')
     
     args = parser.parse_args()
+    args.profile = args.profile or bool(args.profile_report)
+    
+    if args.profile and (args.batch or args.split_volumes):
+        print("警告: 性能分析只支持单本转换，已忽略 --profile")
+        args.profile = False
+    
+    # 批量转换模式
+    if args.batch:
+        run_batch(args.batch, workers=args.workers, max_chapter_size=args.max_chapter_size * 1024,
+                  compress_level=args.compress_level)
+        return
+    
+    if not args.input_dir or not args.output:
+        parser.error('需要指定输入目录和 -o/--output（或使用 --batch 批量模式）')
     
     # 检查输入目录
     input_path = Path(args.input_dir)
@@ -661,16 +1722,37 @@ def main():
         print(f"错误: 输入路径不是目录: {args.input_dir}")
         return
     
+    profiler = ConversionProfiler(top_n=args.profile_top) if args.profile else None
+    
     # 创建转换器并执行转换
     converter = HtmlToEpub(
         input_dir=args.input_dir,
         output_file=args.output,
         title=args.title,
         author=args.author,
-        language=args.language
+        language=args.language,
+        max_chapter_size=args.max_chapter_size * 1024,
+        compress_level=args.compress_level,
+        workers=args.workers,
+        profiler=profiler
     )
     
-    converter.convert(order_config=args.config)
+    if args.split_volumes:
+        converter.convert_volumes(order_config=args.config, split_by=args.split_volumes,
+                                  limit=args.volume_limit, workers=args.workers, manifest=args.manifest)
+    else:
+        converter.convert(order_config=args.config, manifest=args.manifest)
+    
+    # 输出性能分析报告
+    if profiler:
+        if args.profile_report:
+            report_file = Path(args.profile_report)
+        else:
+            output_path = Path(args.output)
+            report_file = output_path.with_name(f'{output_path.stem}_profile.json')
+        profiler.save(report_file)
+        print(profiler.summary())
+        print(f"性能分析报告已保存到: {report_file}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML转EPUB工具的回归测试
+"""
+
+import json
+
+from bs4 import BeautifulSoup
+
+from html_to_epub import HtmlToEpub
+
+
+def write_page(path, title, body):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"<html><head><title>{title}</title></head><body>{body}</body></html>", encoding='utf-8')
+
+
+def split(body_html, max_chapter_size=60):
+    converter = HtmlToEpub('.', 'book.epub', max_chapter_size=max_chapter_size)
+    return converter.split_body(BeautifulSoup(f"<body>{body_html}</body>", 'html.parser').body)
+
+
+def test_split_body_keeps_escaped_text():
+    """拆分后的文本节点保持转义，不会变成真正的元素"""
+    parts = split('<h1>一</h1>&lt;b&gt;不是标签&lt;/b&gt; &amp; 文本<h1>二</h1><p>' + 'x' * 80 + '</p>')
+    assert parts[0][1] == '<h1>一</h1>&lt;b&gt;不是标签&lt;/b&gt; &amp; 文本'
+
+
+def test_split_body_does_not_unwrap_tables_and_lists():
+    """只展开布局容器，正文是单个表格或列表时保留原元素"""
+    rows = ''.join(f'<tr><td>{"x" * 40}</td></tr>' for _ in range(3))
+    assert split(f'<div><table>{rows}</table></div>') is None
+    items = ''.join(f'<li>{"x" * 40}</li>' for _ in range(3))
+    assert split(f'<ul>{items}</ul>') is None
+
+    parts = split(f'<div><h1>一</h1><pre>{"x" * 50}</pre><h1>二</h1><pre>{"y" * 50}</pre></div>', 80)
+    assert [html for _, html in parts] == [f'<h1>一</h1><pre>{"x" * 50}</pre>', f'<h1>二</h1><pre>{"y" * 50}</pre>']
+
+
+def test_split_volumes_with_relative_input_dir(tmp_path, monkeypatch):
+    """输入目录为相对路径时，按顶层目录分卷并正确记录每个源文件所在的分卷"""
+    write_page(tmp_path / 'docs' / 'a' / 'one.html', '一', '<h1>一</h1><p>第一章</p>')
+    write_page(tmp_path / 'docs' / 'b' / 'two.html', '二', '<h1>二</h1><p>第二章</p>')
+    monkeypatch.chdir(tmp_path)
+
+    converter = HtmlToEpub('docs', 'out/book.epub', title='测试', workers=1)
+    assert converter.convert_volumes(split_by='section')
+
+    index = json.loads((tmp_path / 'out' / 'book_volumes.json').read_text(encoding='utf-8'))
+    assert index['chapter_index'] == {'a/one.html': 1, 'b/two.html': 2}
+    assert all(volume['success'] for volume in index['volumes'])
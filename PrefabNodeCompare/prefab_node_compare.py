@@ -2,17 +2,118 @@ import re
 import os
 import yaml
 import json
+import mmap
 from typing import Set, List, Dict
 import sys
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 # 默认配置文件路径
 DEFAULT_CONFIG_FILE = "config.json"
 
+# 批量模式默认的命名规则：Lua文件与预制体同名
+DEFAULT_NAME_RULES = [{"lua": r"(.+)", "prefab": "{1}"}]
+
+LUA_SUFFIXES = ('.lua.txt', '.lua')
+PREFAB_SUFFIX = '.prefab'
+
+class UnityYamlScanner:
+    """
+    Unity YAML 的流式扫描器
+    
+    Unity 序列化文件由许多以 '--- !u!<类型ID> &<fileID>' 开头的文档组成，标准YAML解析器无法处理这种标签。
+    扫描器对文件做内存映射，直接查找 GameObject（类型ID为1）的文档头，只读取这些文档中的 m_Name 行，
+    其余文档不解析；名称使用了转义、跨行等简单扫描无法处理的写法时，可以退回 libyaml 解析该文档
+    """
+    
+    DOCUMENT_START = b'\n---'
+    GAME_OBJECT_HEADER = b'\n--- !u!1 &'
+    NAME_KEY = b'\n  m_Name:'
+    
+    def __init__(self, yaml_fallback: bool = True):
+        self.yaml_fallback = yaml_fallback
+        # 没有编译 libyaml 时退回纯Python的 SafeLoader
+        self.loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    
+    def scan_game_objects(self, file_path: str) -> Dict[int, str]:
+        """返回文件中所有GameObject的 {fileID: 名称}，预制体变体中 stripped 的引用对象不包含在内"""
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return {}
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._scan(data)
+    
+    def _scan(self, data) -> Dict[int, str]:
+        objects = {}
+        # 文档头必须位于行首，pos 指向文档头的 '---'
+        header = self.GAME_OBJECT_HEADER[1:]
+        pos = 0 if data[:len(header)] == header else self._find_header(data, 0)
+        while pos != -1:
+            header_end = data.find(b'\n', pos)
+            if header_end == -1:
+                break
+            doc_end = data.find(self.DOCUMENT_START, header_end)
+            if doc_end == -1:
+                doc_end = len(data)
+            
+            file_id, _, flags = data[pos + len(header):header_end].strip().partition(b' ')
+            if flags != b'stripped' and file_id.lstrip(b'-').isdigit():
+                name = self._read_name(data, header_end, doc_end)
+                if name is None and self.yaml_fallback:
+                    name = self._load_name(data[header_end + 1:doc_end])
+                if name is not None:
+                    objects[int(file_id)] = name
+            
+            pos = self._find_header(data, doc_end)
+        return objects
+    
+    def _find_header(self, data, start: int) -> int:
+        pos = data.find(self.GAME_OBJECT_HEADER, start)
+        return pos + 1 if pos != -1 else -1
+    
+    def _read_name(self, data, start: int, end: int):
+        """读取文档中 m_Name 的值，无法按单行标量处理时返回 None"""
+        key = data.find(self.NAME_KEY, start, end)
+        if key == -1:
+            return None
+        line_end = data.find(b'\n', key + 1, end)
+        if line_end == -1:
+            line_end = end
+        elif data[line_end + 1:line_end + 5] == b'    ':
+            # 缩进更深的下一行是跨行标量的延续
+            return None
+        
+        value = data[key + len(self.NAME_KEY):line_end].strip().decode('utf-8', 'replace')
+        if not value:
+            return ''
+        if value[0] == "'":
+            if len(value) > 1 and value.endswith("'"):
+                return value[1:-1].replace("''", "'")
+            return None
+        if value[0] == '"':
+            if len(value) > 1 and value.endswith('"') and '\\' not in value:
+                return value[1:-1]
+            return None
+        if value[0] in '[{&*!|>':
+            return None
+        return value
+    
+    def _load_name(self, document: bytes):
+        """用YAML解析器读取单个文档中的名称，文档头的Unity标签已去掉"""
+        try:
+            parsed = yaml.load(document.decode('utf-8', 'replace'), Loader=self.loader)
+        except yaml.YAMLError:
+            return None
+        game_object = parsed.get('GameObject') if isinstance(parsed, dict) else None
+        if isinstance(game_object, dict) and game_object.get('m_Name') is not None:
+            return str(game_object['m_Name'])
+        return None
+
 class NodeChecker:
-    def __init__(self):
+    def __init__(self, yaml_fallback: bool = True):
         self.code_nodes = set()
         self.prefab_nodes = set()
+        self.scanner = UnityYamlScanner(yaml_fallback)
     
     def extract_nodes_from_lua_code(self, lua_file_path: str) -> Set[str]:
         """从Lua代码中提取所有self:GetObject调用的节点名称"""
@@ -45,54 +146,25 @@ class NodeChecker:
             
         return nodes
     
-    def extract_nodes_from_prefab(self, prefab_file_path: str) -> Set[str]:
-        """从Unity预制体文件中提取所有GameObject节点名称"""
-        nodes = set()
-        
+    def extract_game_objects(self, prefab_file_path: str) -> Dict[int, str]:
+        """从Unity预制体文件中提取所有GameObject的 {fileID: 节点名称}"""
         # 规范化路径
         prefab_file_path = os.path.normpath(prefab_file_path)
         
         try:
-            with open(prefab_file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            # Unity预制体文件是YAML格式，但我们可以用正则表达式简单提取
-            # 匹配 m_Name: 节点名称
-            name_pattern = r'm_Name:\s*([^\n\r]+)'
-            matches = re.findall(name_pattern, content)
-            
-            for match in matches:
-                # 清理名称，移除引号和空格
-                clean_name = match.strip().strip('"\'')
-                if clean_name and clean_name.startswith('_'):
-                    nodes.add(clean_name)
-                    
-            # 也可以尝试解析为YAML（如果格式标准的话）
-            try:
-                # 分割文档（Unity预制体通常包含多个YAML文档）
-                documents = content.split('---')
-                for doc in documents:
-                    if 'GameObject:' in doc:
-                        try:
-                            yaml_doc = yaml.safe_load(doc)
-                            if yaml_doc and isinstance(yaml_doc, dict):
-                                if 'GameObject' in yaml_doc:
-                                    game_object = yaml_doc['GameObject']
-                                    if 'm_Name' in game_object:
-                                        name = game_object['m_Name']
-                                        if name and name.startswith('_'):
-                                            nodes.add(name)
-                        except:
-                            continue
-            except:
-                pass  # 如果YAML解析失败，使用正则表达式的结果
-                
+            return self.scanner.scan_game_objects(prefab_file_path)
         except FileNotFoundError:
             print(f"预制体文件未找到: {prefab_file_path}")
         except Exception as e:
             print(f"读取预制体文件时出错: {e}")
             
-        return nodes
+        return {}
+    
+    def extract_nodes_from_prefab(self, prefab_file_path: str) -> Set[str]:
+        """从Unity预制体文件中提取所有GameObject节点名称"""
+        game_objects = self.extract_game_objects(prefab_file_path)
+        # 通常UI节点以下划线开头
+        return {name for name in game_objects.values() if name.startswith('_')}
     
     def find_missing_nodes(self, lua_file_path: str, prefab_file_path: str) -> Dict[str, Set[str]]:
         """查找代码中存在但预制体中不存在的节点"""
@@ -167,6 +239,18 @@ class NodeChecker:
                     print(f"\n💡 预制体中未使用的节点:", file=out)
                     for node in sorted(unused_nodes):
                         print(f"   - {node}", file=out)
+            
+            # 批量检查时在末尾输出汇总
+            if len(results) > 1:
+                checked = [result for result in results.values() if 'error' not in result]
+                with_missing = [result for result in checked if result.get('missing')]
+                print("\n" + "=" * 80, file=out)
+                print("汇总", file=out)
+                print("=" * 80, file=out)
+                print(f"检查的文件对数: {len(checked)}", file=out)
+                print(f"有缺失节点的文件数: {len(with_missing)}", file=out)
+                print(f"缺失节点总数: {sum(len(result['missing']) for result in with_missing)}", file=out)
+                print(f"未能检查的文件数: {len(results) - len(checked)}", file=out)
         finally:
             if close_file:
                 out.close()
@@ -190,11 +274,166 @@ def load_config(config_file: str = DEFAULT_CONFIG_FILE) -> Dict:
         print(f"读取配置文件失败: {e}")
         return {}
 
+def strip_lua_suffix(file_name: str):
+    """去掉 .lua 或 .lua.txt 后缀，不是Lua文件时返回 None"""
+    lower = file_name.lower()
+    for suffix in LUA_SUFFIXES:
+        if lower.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return None
+
+def find_lua_files(lua_root: str) -> List[str]:
+    """列出目录中所有Lua文件的相对路径（使用 '/' 分隔）"""
+    files = []
+    for dir_path, _, file_names in os.walk(lua_root):
+        relative_dir = os.path.relpath(dir_path, lua_root).replace(os.sep, '/')
+        for file_name in file_names:
+            if strip_lua_suffix(file_name) is not None:
+                files.append(file_name if relative_dir == '.' else f"{relative_dir}/{file_name}")
+    return sorted(files)
+
+def index_prefabs(prefab_root: str) -> Dict[str, List[str]]:
+    """按预制体名称（不区分大小写）索引目录中所有预制体的相对路径"""
+    index = {}
+    for dir_path, _, file_names in os.walk(prefab_root):
+        relative_dir = os.path.relpath(dir_path, prefab_root).replace(os.sep, '/')
+        for file_name in file_names:
+            if file_name.lower().endswith(PREFAB_SUFFIX):
+                name = file_name[:-len(PREFAB_SUFFIX)].lower()
+                index.setdefault(name, []).append(file_name if relative_dir == '.' else f"{relative_dir}/{file_name}")
+    return index
+
+def compile_name_rules(rules: List[Dict]) -> List:
+    """
+    编译命名规则
+    
+    每条规则的 lua 是匹配Lua文件名（不含后缀）的正则表达式，prefab 是生成预制体名称的模板，
+    {0} 为整个匹配，{1}、{2} 为分组，{name} 为命名分组
+    """
+    compiled = []
+    for rule in rules:
+        try:
+            compiled.append((re.compile(rule['lua']), rule['prefab']))
+        except (KeyError, TypeError, re.error) as e:
+            raise ValueError(f"无效的命名规则 {rule}: {e}")
+    return compiled
+
+def apply_name_rules(lua_name: str, rules: List, prefab_index: Dict[str, List[str]]) -> List[str]:
+    """按顺序尝试命名规则，返回第一个存在的预制体名称对应的预制体路径"""
+    for regex, template in rules:
+        match = regex.fullmatch(lua_name)
+        if not match:
+            continue
+        try:
+            prefab_name = template.format(match.group(0), *match.groups(''), **match.groupdict(''))
+        except (IndexError, KeyError) as e:
+            raise ValueError(f"命名规则模板 '{template}' 引用了不存在的分组: {e}")
+        candidates = prefab_index.get(prefab_name.lower())
+        if candidates:
+            return candidates
+    return []
+
+def load_mapping(mapping_file: str) -> Dict[str, str]:
+    """
+    读取映射文件：{Lua相对路径: 预制体相对路径} 或 [[Lua相对路径, 预制体相对路径], ...]
+    
+    预制体路径为空表示跳过该Lua文件；格式不正确时抛出 ValueError
+    """
+    mapping = load_config(mapping_file)
+    if isinstance(mapping, dict):
+        entries = list(mapping.items())
+    elif isinstance(mapping, list):
+        entries = mapping
+    else:
+        raise ValueError(f"映射文件应为字典或列表: {mapping_file}")
+    
+    result = {}
+    for entry in entries:
+        if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+            raise ValueError(f"映射文件中的条目应为 [Lua相对路径, 预制体相对路径]: {entry}")
+        lua, prefab = entry
+        if not isinstance(lua, str) or not (prefab is None or isinstance(prefab, str)):
+            raise ValueError(f"映射文件中的路径应为字符串: {lua} -> {prefab}")
+        result[lua.replace('\\', '/')] = prefab.replace('\\', '/') if prefab else None
+    return result
+
+def pair_files(lua_root: str, prefab_root: str, name_rules: List[Dict] = None,
+               mapping: Dict[str, str] = None) -> List:
+    """
+    配对Lua文件和预制体，映射文件中的条目优先于命名规则
+    
+    Returns:
+        [(Lua相对路径, 预制体相对路径, 错误信息)]，配对成功时错误信息为 None
+    """
+    rules = compile_name_rules(name_rules or DEFAULT_NAME_RULES)
+    prefab_index = index_prefabs(prefab_root)
+    mapping = mapping or {}
+    
+    pairs = []
+    for lua_file in sorted(set(find_lua_files(lua_root)) | set(mapping)):
+        if lua_file in mapping:
+            if mapping[lua_file]:
+                pairs.append((lua_file, mapping[lua_file], None))
+            continue
+        
+        candidates = apply_name_rules(strip_lua_suffix(os.path.basename(lua_file)), rules, prefab_index)
+        if len(candidates) == 1:
+            pairs.append((lua_file, candidates[0], None))
+        elif candidates:
+            pairs.append((lua_file, None, f"找到多个同名预制体，请在映射文件中指定: {', '.join(sorted(candidates))}"))
+        else:
+            pairs.append((lua_file, None, "未找到对应的预制体"))
+    return pairs
+
+def _check_pair(task) -> Dict:
+    """进程池中检查一对文件，未配对的Lua文件只提取代码中的节点"""
+    lua_path, prefab_path, error, yaml_fallback = task
+    checker = NodeChecker(yaml_fallback)
+    if not os.path.isfile(lua_path):
+        # 映射文件中可能写了不存在的Lua文件
+        return {'error': f"Lua文件不存在: {lua_path}", 'code_total': set()}
+    if error:
+        return {'error': error, 'code_total': checker.extract_nodes_from_lua_code(lua_path)}
+    if not os.path.exists(prefab_path):
+        return {'error': f"预制体文件不存在: {prefab_path}", 'code_total': checker.extract_nodes_from_lua_code(lua_path)}
+    return checker.find_missing_nodes(lua_path, prefab_path)
+
+def check_project(lua_root: str, prefab_root: str, name_rules: List[Dict] = None,
+                  mapping: Dict[str, str] = None, workers: int = None,
+                  yaml_fallback: bool = True) -> Dict[str, Dict]:
+    """
+    在进程池中检查项目中所有配对的Lua文件和预制体
+    
+    Returns:
+        {"Lua相对路径 -> 预制体相对路径": 检查结果}，可直接传给 print_results；
+        按命名规则未能配对、且代码中没有节点引用的Lua文件不计入结果
+    """
+    pairs = pair_files(lua_root, prefab_root, name_rules, mapping)
+    tasks = [(os.path.join(lua_root, lua_file), os.path.join(prefab_root, prefab_file) if prefab_file else None,
+              error, yaml_fallback)
+             for lua_file, prefab_file, error in pairs]
+    
+    with ProcessPoolExecutor(max_workers=workers or None) as executor:
+        checked = list(executor.map(_check_pair, tasks, chunksize=max(1, len(tasks) // 256)))
+    
+    results = {}
+    for (lua_file, prefab_file, _), result in zip(pairs, checked):
+        if prefab_file is None and not result['code_total']:
+            continue
+        results[f"{lua_file} -> {prefab_file or '(未配对)'}"] = result
+    return results
+
 def create_default_config(config_file: str = DEFAULT_CONFIG_FILE):
     """创建默认配置文件"""
     config = {
         "lua_file": "",
         "prefab_file": "",
+        "lua_root": "",
+        "prefab_root": "",
+        "mapping_file": "",
+        "name_rules": DEFAULT_NAME_RULES,
+        "workers": 0,
+        "yaml_fallback": True,
         "output_file": "node_check_results.txt"
     }
     
@@ -229,9 +468,14 @@ def main():
     prefab_file = config.get('prefab_file')
     output_file = config.get('output_file')
     
+    # 配置了 lua_root 和 prefab_root 时检查整个项目
+    if config.get('lua_root') and config.get('prefab_root'):
+        batch_main(config)
+        return
+    
     # 验证配置
     if not lua_file or not prefab_file:
-        print("配置文件中缺少必要的路径设置 (lua_file 和 prefab_file)")
+        print("配置文件中缺少必要的路径设置 (lua_file 和 prefab_file，或 lua_root 和 prefab_root)")
         return
     
     # 规范化路径
@@ -252,7 +496,7 @@ def main():
     print(f"  Lua文件: {lua_file}")
     print(f"  预制体文件: {prefab_file}")
     
-    checker = NodeChecker()
+    checker = NodeChecker(config.get('yaml_fallback', True))
     result = checker.find_missing_nodes(lua_file, prefab_file)
     
     # 输出结果
@@ -264,5 +508,51 @@ def main():
     
     print("\n检查完成！")
 
+def batch_main(config: Dict):
+    """批量模式：按命名规则或映射文件配对项目中的所有Lua文件和预制体"""
+    lua_root = os.path.normpath(config['lua_root'])
+    prefab_root = os.path.normpath(config['prefab_root'])
+    output_file = config.get('output_file')
+    
+    for name, path in (("Lua目录", lua_root), ("预制体目录", prefab_root)):
+        if not os.path.isdir(path):
+            print(f"{name}不存在: {path}")
+            return
+    
+    mapping = None
+    if config.get('mapping_file'):
+        try:
+            mapping = load_mapping(config['mapping_file'])
+        except ValueError as e:
+            print(f"配置错误: {e}")
+            return
+        if not mapping:
+            print("映射文件为空或无效")
+            return
+    
+    print(f"正在检查项目:")
+    print(f"  Lua目录: {lua_root}")
+    print(f"  预制体目录: {prefab_root}")
+    if mapping:
+        print(f"  映射文件: {config['mapping_file']} ({len(mapping)} 项)")
+    
+    try:
+        results = check_project(lua_root, prefab_root, config.get('name_rules'), mapping, config.get('workers'),
+                                config.get('yaml_fallback', True))
+    except ValueError as e:
+        print(f"配置错误: {e}")
+        return
+    
+    if not results:
+        print("没有找到需要检查的文件")
+        return
+    
+    NodeChecker().print_results(results, output_file)
+    
+    if output_file:
+        print(f"\n结果已输出到文件: {output_file}")
+    
+    print(f"\n检查完成！共 {len(results)} 个文件")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file